@@ -0,0 +1,111 @@
+# Tools/SubstancePainter/lib_costmodel.py
+# Per-phase duration model fitted from earlier runs.
+#   history: JSON lines {"t", "features": {...}, "phases": {phase: seconds}} appended after each successful run
+#   model:   per phase, duration = b0 + sum(bi * feature_i), ridge-fitted towards PRIOR so that a
+#            handful of runs only nudges the defaults and an empty history still gives an estimate
+import json
+import os
+
+# phase -> features its duration scales with (names produced by the runner's planner)
+PHASE_FEATURES = {
+    'startup': (),
+    'stage_wait': ('input_mb',),
+    'ensure_project': ('mesh_mb', 'doc_mpix'),
+    'wait_texturesets': ('mesh_mb',),
+    'apply': ('imports', 'import_mpix'),
+    'export': ('export_mpix',),
+    'repack': ('export_mpix',),
+    'variant_apply': ('variants', 'variant_imports', 'variant_import_mpix'),
+    'variant_save': ('variants',),
+    'variant_export': ('variant_export_mpix',),
+}
+
+# starting coefficients [intercept, *features] before any history exists
+PRIOR = {
+    'startup': [45.0],
+    'stage_wait': [0.5, 0.05],
+    'ensure_project': [8.0, 0.5, 0.5],
+    'wait_texturesets': [1.0, 0.05],
+    'apply': [2.0, 1.5, 0.3],
+    'export': [3.0, 0.4],
+    'repack': [0.5, 0.1],
+    'variant_apply': [0.0, 1.0, 1.5, 0.3],
+    'variant_save': [0.0, 5.0],
+    'variant_export': [0.0, 0.45],
+}
+
+RIDGE = 2.0
+
+def load_history(path, limit=1000):
+    """Most recent history rows (at most limit); unreadable lines are skipped."""
+    rows = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except Exception:
+                    continue
+    except OSError:
+        return []
+    return rows[-limit:]
+
+def append_history(path, row):
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+def _solve(a, b):
+    """Solve a x = b (small dense system) by Gauss-Jordan elimination with partial pivoting."""
+    n = len(b)
+    m = [list(a[i]) + [b[i]] for i in range(n)]
+    for c in range(n):
+        p = max(range(c, n), key=lambda r: abs(m[r][c]))
+        if abs(m[p][c]) < 1e-12:
+            return None
+        m[c], m[p] = m[p], m[c]
+        for r in range(n):
+            if r != c:
+                f = m[r][c] / m[c][c]
+                m[r] = [x - f * y for x, y in zip(m[r], m[c])]
+    return [m[i][n] / m[i][i] for i in range(n)]
+
+def _fit_phase(samples, prior):
+    """Ridge regression towards prior: (X'X + kI) b = X'y + k b0, with b clamped non-negative."""
+    n = len(prior)
+    xtx = [[RIDGE if i == j else 0.0 for j in range(n)] for i in range(n)]
+    xty = [RIDGE * p for p in prior]
+    for x, y in samples:
+        for i in range(n):
+            xty[i] += x[i] * y
+            for j in range(n):
+                xtx[i][j] += x[i] * x[j]
+    coef = _solve(xtx, xty) or list(prior)
+    return [max(0.0, c) for c in coef]
+
+def fit(rows):
+    """Per-phase coefficients from history rows: {phase: {"features", "coef", "samples"}}."""
+    model = {}
+    for phase, names in PHASE_FEATURES.items():
+        samples = []
+        for r in rows:
+            dur = (r.get('phases') or {}).get(phase)
+            feats = r.get('features') or {}
+            if dur is None or any(feats.get(k) is None for k in names):
+                continue
+            samples.append(([1.0] + [float(feats[k]) for k in names], float(dur)))
+        model[phase] = {'features': list(names), 'coef': _fit_phase(samples, PRIOR[phase]), 'samples': len(samples)}
+    return model
+
+def predict(model, features, phases):
+    """Estimated seconds per phase (phases not in the model are skipped)."""
+    out = {}
+    for phase in phases:
+        m = model.get(phase)
+        if not m:
+            continue
+        x = [1.0] + [float(features.get(k) or 0.0) for k in m['features']]
+        out[phase] = round(sum(c * v for c, v in zip(m['coef'], x)), 1)
+    return out
@@ -0,0 +1,110 @@
+# Tools/SubstancePainter/lib_image.py
+# Image dimensions read from file headers only (no decode, no third-party deps).
+#   PNG / JPEG / TGA / TIFF / PSD / EXR natively; anything else via Pillow when installed.
+import struct
+
+def _png(f):
+    head = f.read(24)
+    if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    return None
+
+def _jpeg(f):
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        b = f.read(1)
+        while b and b != b'\xff':
+            b = f.read(1)
+        while b == b'\xff':
+            b = f.read(1)
+        if not b:
+            return None
+        marker = b[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        size = struct.unpack('>H', seg)[0]
+        # SOF0..SOF15 except DHT (C4), JPG (C8), DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack('>xHH', f.read(5))
+            return w, h
+        f.seek(size - 2, 1)
+
+def _tga(f):
+    head = f.read(18)
+    if len(head) < 18 or head[2] not in (1, 2, 3, 9, 10, 11):
+        return None
+    return struct.unpack('<HH', head[12:16])
+
+def _tiff(f):
+    order = f.read(2)
+    if order not in (b'II', b'MM'):
+        return None
+    e = '<' if order == b'II' else '>'
+    if struct.unpack(e + 'H', f.read(2))[0] != 42:
+        return None
+    f.seek(struct.unpack(e + 'I', f.read(4))[0])
+    w = h = None
+    for _ in range(struct.unpack(e + 'H', f.read(2))[0]):
+        tag, typ, _, val = struct.unpack(e + 'HHI4s', f.read(12))
+        v = struct.unpack(e + ('H' if typ == 3 else 'I'), val[:2 if typ == 3 else 4])[0]
+        if tag == 256:
+            w = v
+        elif tag == 257:
+            h = v
+    return (w, h) if w and h else None
+
+def _psd(f):
+    head = f.read(26)
+    if head[:4] != b'8BPS':
+        return None
+    h, w = struct.unpack('>II', head[14:22])
+    return w, h
+
+def _exr(f):
+    if f.read(4) != b'\x76\x2f\x31\x01':
+        return None
+    f.read(4)
+    while True:
+        name = b''
+        c = f.read(1)
+        while c and c != b'\0':
+            name += c
+            c = f.read(1)
+        if not name:
+            return None
+        typ = b''
+        c = f.read(1)
+        while c and c != b'\0':
+            typ += c
+            c = f.read(1)
+        size = struct.unpack('<I', f.read(4))[0]
+        if name == b'dataWindow' and typ == b'box2i':
+            x0, y0, x1, y1 = struct.unpack('<iiii', f.read(16))
+            return x1 - x0 + 1, y1 - y0 + 1
+        f.seek(size, 1)
+
+_READERS = {'.png': _png, '.jpg': _jpeg, '.jpeg': _jpeg, '.tga': _tga, '.tif': _tiff, '.tiff': _tiff,
+            '.psd': _psd, '.exr': _exr}
+
+def image_size(path):
+    """(width, height) of an image file, or None if it cannot be determined."""
+    ext = path[path.rfind('.'):].lower() if '.' in path else ''
+    reader = _READERS.get(ext)
+    if reader is not None:
+        try:
+            with open(path, 'rb') as f:
+                size = reader(f)
+            if size:
+                return int(size[0]), int(size[1])
+        except Exception:
+            pass
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            return im.size
+    except Exception:
+        return None
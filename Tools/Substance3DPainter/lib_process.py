@@ -0,0 +1,198 @@
+# Tools/SubstancePainter/lib_process.py
+# CPU / RSS sampling of an external process (the Painter instance) without third-party deps.
+#   Linux:   /proc/<pid>/stat (utime+stime) and /proc/<pid>/status (VmRSS)
+#   Windows: GetProcessTimes + K32GetProcessMemoryInfo (WorkingSetSize) via ctypes
+#   other:   psutil when installed, otherwise sampling is disabled
+import csv
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+def _read_linux(pid):
+    with open(f'/proc/{pid}/stat', 'r') as f:
+        stat = f.read()
+    # comm may contain spaces; fields after the closing paren are fixed
+    fields = stat[stat.rfind(')') + 2:].split()
+    ticks = os.sysconf('SC_CLK_TCK')
+    cpu_sec = (int(fields[11]) + int(fields[12])) / float(ticks)
+    rss = 0
+    with open(f'/proc/{pid}/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) * 1024
+                break
+    return {'cpu_sec': cpu_sec, 'rss': rss}
+
+def _read_windows(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    class FILETIME(ctypes.Structure):
+        _fields_ = [('lo', wintypes.DWORD), ('hi', wintypes.DWORD)]
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (n, ctypes.c_size_t) for n in (
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+    k32 = ctypes.windll.kernel32
+    k32.OpenProcess.restype = wintypes.HANDLE
+    h = k32.OpenProcess(0x1000, False, int(pid))  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not h:
+        return None
+    try:
+        c, e, k, u = FILETIME(), FILETIME(), FILETIME(), FILETIME()
+        if not k32.GetProcessTimes(h, ctypes.byref(c), ctypes.byref(e), ctypes.byref(k), ctypes.byref(u)):
+            return None
+        cpu_sec = (((k.hi << 32) | k.lo) + ((u.hi << 32) | u.lo)) / 1e7
+        pmc = PROCESS_MEMORY_COUNTERS()
+        pmc.cb = ctypes.sizeof(pmc)
+        if not k32.K32GetProcessMemoryInfo(h, ctypes.byref(pmc), pmc.cb):
+            return None
+        return {'cpu_sec': cpu_sec, 'rss': int(pmc.WorkingSetSize)}
+    finally:
+        k32.CloseHandle(h)
+
+def _read_psutil(pid):
+    import psutil
+    p = psutil.Process(pid)
+    t = p.cpu_times()
+    return {'cpu_sec': t.user + t.system, 'rss': p.memory_info().rss}
+
+def read_process_stats(pid):
+    """Cumulative CPU seconds and RSS bytes of pid, or None if unavailable."""
+    if not pid:
+        return None
+    try:
+        if sys.platform.startswith('linux'):
+            return _read_linux(pid)
+        if sys.platform == 'win32':
+            return _read_windows(pid)
+        return _read_psutil(pid)
+    except Exception:
+        return None
+
+def _alive_windows(pid):
+    import ctypes
+    from ctypes import wintypes
+    k32 = ctypes.windll.kernel32
+    k32.OpenProcess.restype = wintypes.HANDLE
+    h = k32.OpenProcess(0x1000, False, int(pid))  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not h:
+        return False
+    try:
+        code = wintypes.DWORD()
+        if not k32.GetExitCodeProcess(h, ctypes.byref(code)):
+            return False
+        return code.value == 259  # STILL_ACTIVE
+    finally:
+        k32.CloseHandle(h)
+
+def is_alive(pid):
+    """True while pid is running; an exited child that was not waited on (zombie) counts as dead."""
+    if not pid:
+        return False
+    try:
+        if sys.platform.startswith('linux'):
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                stat = f.read()
+            return stat[stat.rfind(')') + 2:].split()[0] not in ('Z', 'X')
+        if sys.platform == 'win32':
+            return _alive_windows(pid)
+        import psutil
+        p = psutil.Process(pid)
+        return p.is_running() and p.status() != psutil.STATUS_ZOMBIE
+    except Exception:
+        return False
+
+def find_pids(name_fragment):
+    """PIDs whose image name (Windows) or command line (Linux) contains name_fragment."""
+    frag = name_fragment.lower()
+    pids = []
+    try:
+        if sys.platform == 'win32':
+            out = subprocess.run(['tasklist', '/FO', 'CSV', '/NH'], capture_output=True, text=True, timeout=10).stdout
+            for row in csv.reader(io.StringIO(out)):
+                if len(row) >= 2 and frag in row[0].lower() and row[1].isdigit():
+                    pids.append(int(row[1]))
+        elif os.path.isdir('/proc'):
+            for d in os.listdir('/proc'):
+                if not d.isdigit():
+                    continue
+                try:
+                    with open(f'/proc/{d}/cmdline', 'rb') as f:
+                        cmd = f.read().replace(b'\0', b' ').decode('utf-8', 'replace').lower()
+                except OSError:
+                    continue
+                if frag in cmd:
+                    pids.append(int(d))
+    except Exception:
+        pass
+    return pids
+
+class ProcessSampler(threading.Thread):
+    """Background sampler of one process; each sample is tagged with the current phase."""
+
+    def __init__(self, pid=None, interval=1.0, max_samples=20000):
+        super().__init__(daemon=True)
+        self.interval = max(0.1, float(interval))
+        self.max_samples = max_samples
+        self.samples = []
+        self._pid = pid
+        self._phase = None
+        self._prev = None
+        self._stop_evt = threading.Event()
+        self._lock = threading.Lock()
+
+    def set_pid(self, pid):
+        with self._lock:
+            if pid != self._pid:
+                self._pid = pid
+                self._prev = None
+
+    def set_phase(self, phase):
+        with self._lock:
+            self._phase = phase
+
+    def sample(self):
+        with self._lock:
+            pid, phase, prev = self._pid, self._phase, self._prev
+        st = read_process_stats(pid)
+        if st is None:
+            return None
+        now = time.time()
+        cpu_pct = None
+        if prev is not None and now > prev[0]:
+            cpu_pct = round(100.0 * (st['cpu_sec'] - prev[1]) / (now - prev[0]), 1)
+        s = {'t': round(now, 3), 'phase': phase, 'pid': pid, 'rss_mb': round(st['rss'] / 1048576.0, 1), 'cpu_pct': cpu_pct}
+        with self._lock:
+            self._prev = (now, st['cpu_sec'])
+            if len(self.samples) < self.max_samples:
+                self.samples.append(s)
+        return s
+
+    def run(self):
+        while not self._stop_evt.is_set():
+            self.sample()
+            self._stop_evt.wait(self.interval)
+
+    def stop(self):
+        self._stop_evt.set()
+        if self.is_alive():
+            self.join(timeout=self.interval * 2)
+
+    def summary(self, phase=None):
+        with self._lock:
+            rows = [s for s in self.samples if phase is None or s['phase'] == phase]
+        cpu = [s['cpu_pct'] for s in rows if s['cpu_pct'] is not None]
+        return {
+            'samples': len(rows),
+            'max_rss_mb': max((s['rss_mb'] for s in rows), default=None),
+            'last_rss_mb': rows[-1]['rss_mb'] if rows else None,
+            'avg_cpu_pct': round(sum(cpu) / len(cpu), 1) if cpu else None,
+            'max_cpu_pct': max(cpu, default=None),
+        }
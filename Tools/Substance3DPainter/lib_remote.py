@@ -3,13 +3,17 @@
 # Painter must be started with --enable-remote-scripting.
 import base64
 import json
+import time
 import urllib.request
 
 class RemotePainter:
     def __init__(self, host="localhost", port=60041):
         self.base = f"http://{host}:{port}"
+        # Timing of the most recent request: encode_sec (base64 + JSON), http_sec, bytes_sent, bytes_recv
+        self.last_timing = {}
 
     def _post(self, path, payload: dict, timeout=60):
+        t0 = time.perf_counter()
         data = json.dumps(payload).encode("utf-8")
         req = urllib.request.Request(
             self.base + path,
@@ -17,14 +21,25 @@ class RemotePainter:
             headers={"Content-Type": "application/json"},
             method="POST"
         )
-        with urllib.request.urlopen(req, timeout=timeout) as res:
-            return res.read().decode("utf-8", errors="replace")
+        self.last_timing["encode_sec"] = self.last_timing.get("encode_sec", 0.0) + time.perf_counter() - t0
+        self.last_timing["bytes_sent"] = len(data)
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as res:
+                body = res.read()
+        finally:
+            self.last_timing["http_sec"] = time.perf_counter() - t0
+        self.last_timing["bytes_recv"] = len(body)
+        return body.decode("utf-8", errors="replace")
 
     def checkConnection(self):
+        self.last_timing = {}
         return self._post("/run.json", {"js": ""}, timeout=5)
 
     def execScript(self, code: str, lang: str = "python", timeout=300):
+        t0 = time.perf_counter()
         b64 = base64.b64encode(code.encode("utf-8")).decode("ascii")
+        self.last_timing = {"encode_sec": time.perf_counter() - t0}
         lang = lang.lower()
         if lang == "python":
             return self._post("/run.json", {"python": b64}, timeout=timeout)
@@ -0,0 +1,165 @@
+# Tools/SubstancePainter/lib_staging.py
+# Content-addressed local staging cache for job inputs (mesh / textures on network shares or Unity folders).
+#   <root>/<sha256[:16]>/<original file name>   staged copy (mtime preserved, so size/mtime signatures hold);
+#                                                identical content under another name is hard-linked beside it
+#   <root>/staging_index.json                    {"entries": {hash: {...}}, "sources": {source key: hash}}
+# A source whose (path, mtime, size) is already indexed is not read again; entries are evicted LRU
+# once the cache exceeds its size cap.
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+INDEX_NAME = 'staging_index.json'
+
+def _source_key(path, st):
+    return '|'.join([os.path.normcase(os.path.abspath(path)), str(st.st_mtime_ns), str(st.st_size)])
+
+class StagingCache:
+    """Copies input files into a local cache keyed by content hash."""
+
+    def __init__(self, root, max_bytes=20 * 1024 ** 3, workers=8, chunk=4 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max(0, int(max_bytes))
+        self.workers = max(1, int(workers))
+        self.chunk = chunk
+        self._lock = threading.Lock()
+        self.index = self._load_index()
+        self.stats = {'staged': 0, 'hits': 0, 'bytes_copied': 0, 'evicted': 0, 'bytes_evicted': 0, 'errors': []}
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.root, INDEX_NAME), 'r', encoding='utf-8') as f:
+                idx = json.load(f)
+            if isinstance(idx, dict):
+                idx.setdefault('entries', {})
+                idx.setdefault('sources', {})
+                return idx
+        except Exception:
+            pass
+        return {'entries': {}, 'sources': {}}
+
+    def _save_index(self):
+        path = os.path.join(self.root, INDEX_NAME)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+    def _link_sibling(self, h, dst, size):
+        """Make dst (this source's name under the hash folder) from a copy already staged for h.
+        Hard link when the filesystem allows it, copy otherwise. Returns the bytes copied, or None."""
+        if os.path.isfile(dst) and os.path.getsize(dst) == size:
+            return 0
+        with self._lock:
+            e = self.index['entries'].get(h)
+        sib = os.path.join(self.root, e['rel']) if e else None
+        if not sib or not os.path.isfile(sib) or os.path.getsize(sib) != size:
+            return None
+        try:
+            os.link(sib, dst)
+            return 0
+        except FileExistsError:
+            return 0
+        except OSError:
+            shutil.copy2(sib, dst)
+            return size
+
+    def _stage_one(self, src):
+        st = os.stat(src)
+        skey = _source_key(src, st)
+        name = os.path.basename(src)
+        with self._lock:
+            h = self.index['sources'].get(skey)
+        if h:
+            # staged under this source's own name, so Painter names the imported resource after it
+            dst = os.path.join(self.root, h[:16], name)
+            copied = self._link_sibling(h, dst, st.st_size)
+            if copied is not None:
+                with self._lock:
+                    e = self.index['entries'][h]
+                    e['last_used'] = time.time()
+                    e['size'] += copied
+                    self.stats['hits'] += 1
+                    self.stats['bytes_copied'] += copied
+                return dst, h
+        # single read of the source: hash while copying into a temp file, then move into place
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, '.tmp-%d-%d-%s' % (os.getpid(), threading.get_ident(), name))
+        hasher = hashlib.sha256()
+        try:
+            with open(src, 'rb') as fi, open(tmp, 'wb') as fo:
+                while True:
+                    b = fi.read(self.chunk)
+                    if not b:
+                        break
+                    hasher.update(b)
+                    fo.write(b)
+            h = hasher.hexdigest()
+            dst = os.path.join(self.root, h[:16], name)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            # same content already staged (under this or another name): link to it instead of a second copy
+            copied = self._link_sibling(h, dst, st.st_size)
+            if copied is None:
+                shutil.copystat(src, tmp)
+                os.replace(tmp, dst)
+                copied = st.st_size
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            e = self.index['entries'].get(h)
+            if e is None:
+                e = self.index['entries'][h] = {'rel': os.path.relpath(dst, self.root), 'size': 0}
+            elif not os.path.isfile(os.path.join(self.root, e['rel'])):
+                e['rel'] = os.path.relpath(dst, self.root)
+            e['size'] += copied
+            e['last_used'] = time.time()
+            self.index['sources'][skey] = h
+            self.stats['staged'] += 1
+            self.stats['bytes_copied'] += copied
+        return dst, h
+
+    def stage(self, paths):
+        """Stage paths in parallel. Returns {source path: (staged path, sha256)}; failures are left out."""
+        todo = sorted(set(p for p in paths if p and os.path.isfile(p)))
+        out = {}
+
+        def run(p):
+            try:
+                out[p] = self._stage_one(p)
+            except Exception as e:
+                with self._lock:
+                    self.stats['errors'].append(f'{p}: {e}')
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(todo))) as ex:
+                list(ex.map(run, todo))
+        self.evict(keep=set(h for (_, h) in out.values()))
+        self._save_index()
+        return out
+
+    def evict(self, keep=()):
+        """Drop least recently used entries (never those in keep) until the cache fits max_bytes."""
+        entries = self.index['entries']
+        total = sum(e.get('size', 0) for e in entries.values())
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+        for h, e in sorted(entries.items(), key=lambda kv: kv[1].get('last_used', 0)):
+            if total <= self.max_bytes:
+                break
+            if h in keep:
+                continue
+            try:
+                shutil.rmtree(os.path.dirname(os.path.join(self.root, e['rel'])), ignore_errors=True)
+            except Exception:
+                pass
+            total -= e.get('size', 0)
+            del entries[h]
+            self.stats['evicted'] += 1
+            self.stats['bytes_evicted'] += e.get('size', 0)
+        live = set(entries)
+        self.index['sources'] = {k: h for k, h in self.index['sources'].items() if h in live}
@@ -0,0 +1,240 @@
+# make_painter_jobs.py
+# Headless job.json generator for bulk conversion without the Unity editor.
+#   - One directory walk collects FBX files and textures named like the Unity exporter writes them:
+#     <TextureSet>_BaseColor / _Normal / _MetallicSmoothness / _AO / _Emission / _Height (+ _Metallic / _Roughness)
+#   - Each FBX becomes one job; its job root is the FBX folder, or the parent of a "_Mesh" folder
+#     (the _SP_Work layout of SubstancePainterObjectExporterWindow.cs). Textures belong to the FBX
+#     with the deepest job root above them and are grouped into TextureSets by name prefix; a root with
+#     several FBX files gives each of them only the TextureSets named after it (Chair_Seat -> Chair.fbx)
+#   - _MetallicSmoothness is split into _Metallic (R) / _Roughness (1 - A) like the Unity exporter,
+#     unless those maps already exist (needs Pillow; --no-split keeps it out of the job instead)
+#   - job.json uses the JobData schema of the Unity exporter (textureSets[].textures[].key/path)
+#
+# Usage:
+#   python make_painter_jobs.py <scanRoot> --painter-exe EXE [--out DIR] [--defaults defaults.json] [--no-split]
+
+import argparse
+import json
+import os
+import sys
+
+# file suffix (lowercased) -> job key; MetallicSmoothness is split before it reaches the job
+SUFFIX_TO_KEY = {
+    'basecolor': 'BaseColor',
+    'normal': 'Normal',
+    'metallicsmoothness': 'MetallicSmoothness',
+    'metallic': 'Metallic',
+    'roughness': 'Roughness',
+    'ao': 'AO',
+    'emission': 'Emission',
+    'height': 'Height',
+}
+
+KEY_ORDER = ('BaseColor', 'Normal', 'Metallic', 'Roughness', 'AO', 'Emission', 'Height')
+
+IMAGE_EXTS = ('.png', '.tga', '.tif', '.tiff', '.jpg', '.jpeg', '.exr', '.psd')
+
+MESH_EXTS = ('.fbx',)
+
+# JobData defaults (SubstancePainterObjectExporterWindow.cs)
+JOB_DEFAULTS = {
+    'painterExePath': '',
+    'painterAppLogPath': '',
+    'existingProjectToCopy': '',
+    'templateSptPath': '',
+    'useUDIM': False,
+    'autoDetectExportPreset': True,
+    'exportPresetNameHint': 'Unity',
+    'exportPresetExactName': '',
+}
+
+def _classify(name):
+    """(TextureSet name, key) for a texture file name, or None."""
+    stem, ext = os.path.splitext(name)
+    if ext.lower() not in IMAGE_EXTS or '_' not in stem:
+        return None
+    prefix, suffix = stem.rsplit('_', 1)
+    key = SUFFIX_TO_KEY.get(suffix.lower())
+    if not key or not prefix:
+        return None
+    return prefix, key
+
+def scan(root, exclude=()):
+    """Walk root once. Returns (meshes, textures): meshes = [path], textures = {dir: {ts: {key: path}}}."""
+    meshes = []
+    textures = {}
+    exclude = set(exclude)
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    if not e.name.startswith('.') and e.name not in exclude:
+                        stack.append(e.path)
+                    continue
+                low = e.name.lower()
+                if low.endswith(MESH_EXTS):
+                    meshes.append(e.path)
+                    continue
+                c = _classify(e.name)
+                if c is not None:
+                    textures.setdefault(d, {}).setdefault(c[0], {})[c[1]] = e.path
+    meshes.sort()
+    return meshes, textures
+
+def _job_root(mesh_path):
+    d = os.path.dirname(mesh_path)
+    return os.path.dirname(d) if os.path.basename(d) == '_Mesh' else d
+
+def _stem(mesh_path):
+    return os.path.splitext(os.path.basename(mesh_path))[0].lower()
+
+def _match_mesh(ts, owner):
+    """Mesh of a multi-mesh root a TextureSet belongs to, by name: exact stem, then the longest stem
+    the set name starts with ("Chair_Seat" -> Chair.fbx), then a stem starting with the set name."""
+    t = ts.lower()
+    for m in owner:
+        if _stem(m) == t:
+            return m
+    best = None
+    for m in owner:
+        st = _stem(m)
+        if t.startswith(st) and (best is None or len(st) > len(_stem(best))):
+            best = m
+    if best is not None:
+        return best
+    hits = [m for m in owner if _stem(m).startswith(t)]
+    return hits[0] if len(hits) == 1 else None
+
+def group(meshes, textures):
+    """Assign texture directories to the mesh with the deepest job root above them.
+
+    When that root holds several FBX files, each TextureSet goes to the mesh it is named after;
+    sets matching none of them are reported as orphans instead of being copied into every job."""
+    roots = {}
+    for m in meshes:
+        roots.setdefault(os.path.normcase(_job_root(m)), []).append(m)
+    assigned = {m: {} for m in meshes}
+    orphans = []
+    for d in sorted(textures):
+        probe = os.path.normcase(d)
+        owner = None
+        while True:
+            if probe in roots:
+                owner = roots[probe]
+                break
+            parent = os.path.dirname(probe)
+            if parent == probe:
+                break
+            probe = parent
+        if owner is None:
+            orphans.append(d)
+            continue
+        for ts, maps in textures[d].items():
+            m = owner[0] if len(owner) == 1 else _match_mesh(ts, owner)
+            if m is None:
+                orphans.append(os.path.join(d, ts))
+                continue
+            assigned[m].setdefault(ts, {}).update(maps)
+    return assigned, orphans
+
+def _split_metallic_smoothness(src, out_dir, ts):
+    """Write <ts>_Metallic.png (R) and <ts>_Roughness.png (1 - A) next to each other in out_dir."""
+    from PIL import Image, ImageOps
+    os.makedirs(out_dir, exist_ok=True)
+    with Image.open(src) as im:
+        im = im.convert('RGBA')
+        r, _, _, a = im.split()
+        met = os.path.join(out_dir, f'{ts}_Metallic.png')
+        rough = os.path.join(out_dir, f'{ts}_Roughness.png')
+        r.save(met)
+        ImageOps.invert(a).save(rough)
+    return met, rough
+
+def build_job(mesh, tsets, job_dir, defaults, split=True, log=None):
+    stem = os.path.splitext(os.path.basename(mesh))[0]
+    texture_sets = []
+    for ts in sorted(tsets):
+        maps = dict(tsets[ts])
+        ms = maps.pop('MetallicSmoothness', None)
+        if ms and split and not ('Metallic' in maps and 'Roughness' in maps):
+            try:
+                met, rough = _split_metallic_smoothness(ms, os.path.join(job_dir, ts), ts)
+                maps.setdefault('Metallic', met)
+                maps.setdefault('Roughness', rough)
+            except Exception as e:
+                if log:
+                    log(f'[warn] {ts}: MetallicSmoothness not split ({type(e).__name__}: {e})')
+        textures = [{'key': k, 'path': os.path.abspath(maps[k])} for k in KEY_ORDER if k in maps]
+        if textures:
+            texture_sets.append({'name': ts, 'textures': textures})
+    job = dict(JOB_DEFAULTS)
+    job.update(defaults)
+    job.update({
+        'meshPath': os.path.abspath(mesh),
+        'outputProjectPath': os.path.abspath(os.path.join(job_dir, f'{stem}.spp')),
+        'exportFolder': os.path.abspath(os.path.join(job_dir, 'Export')),
+        'textureSets': texture_sets,
+    })
+    return job
+
+def generate(root, out_dir, defaults, split=True, exclude=(), log=None):
+    """Scan root and write one <out_dir>/<mesh>/job.json per FBX. Returns the written job paths."""
+    meshes, textures = scan(root, exclude)
+    assigned, orphans = group(meshes, textures)
+    if log:
+        log(f'[scan] {len(meshes)} FBX, {sum(len(v) for v in textures.values())} TextureSet group(s) '
+            f'in {len(textures)} folder(s); {len(orphans)} folder(s)/TextureSet(s) without a mesh')
+    written = []
+    used = set()
+    for m in meshes:
+        stem = os.path.splitext(os.path.basename(m))[0]
+        name, n = stem, 1
+        while name.lower() in used:
+            n += 1
+            name = f'{stem}_{n}'
+        used.add(name.lower())
+        job_dir = os.path.join(out_dir, name)
+        job = build_job(m, assigned[m], job_dir, defaults, split, log)
+        if not job['textureSets']:
+            if log:
+                log(f'[skip] {m}: no textures')
+            continue
+        os.makedirs(job_dir, exist_ok=True)
+        path = os.path.join(job_dir, 'job.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False, indent=4)
+        written.append(path)
+    return written
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Generate Painter job.json files from a folder of FBX files and textures.')
+    ap.add_argument('scan_root')
+    ap.add_argument('--out', default=None, help='Job output folder (default: <scan_root>/_SP_Jobs)')
+    ap.add_argument('--painter-exe', default='', help='painterExePath written into every job')
+    ap.add_argument('--defaults', default=None, help='JSON file with extra job.json fields (e.g. exportTextures, stagingFolder)')
+    ap.add_argument('--no-split', action='store_true', help='Do not split _MetallicSmoothness into _Metallic/_Roughness')
+    ap.add_argument('--exclude', action='append', default=[], help='Folder name to skip (repeatable)')
+    args = ap.parse_args(argv)
+    defaults = {}
+    if args.defaults:
+        with open(args.defaults, 'r', encoding='utf-8-sig') as f:
+            defaults = json.load(f)
+    if args.painter_exe:
+        defaults['painterExePath'] = args.painter_exe
+    out_dir = args.out or os.path.join(args.scan_root, '_SP_Jobs')
+    exclude = list(args.exclude) + [os.path.basename(os.path.normpath(out_dir))]
+    log = lambda m: print(m, file=sys.stderr, flush=True)
+    written = generate(args.scan_root, out_dir, defaults, split=not args.no_split, exclude=exclude, log=log)
+    for p in written:
+        print(p, flush=True)
+    log(f'[done] {len(written)} job(s) written under {out_dir}')
+    return 0 if written else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
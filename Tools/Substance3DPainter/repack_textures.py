@@ -0,0 +1,306 @@
+# repack_textures.py
+# Post-export repack of Painter outputs into the Unity Standard (Metallic) slot layout.
+#   - Metallic (R) + Smoothness = 1 - Roughness (A) -> <TextureSet>_MetallicSmoothness.png (_MetallicGlossMap);
+#     an already packed <TextureSet>_MetallicSmoothness export (Unity Standard preset) is passed through
+#   - Normal: optional DirectX -> OpenGL conversion (green flip) -> <TextureSet>_Normal.png (_BumpMap)
+#   - BaseColor / AO / Emission / Height copied to the names SubstancePainterObjectExporterWindow.cs uses
+#   - NumPy-vectorized, one process per TextureSet, rows streamed in bands straight into the PNG encoder
+#   - Memory: only the output is streamed. Pillow decodes each input map whole, so a worker holds the
+#     decoded inputs of one map pair plus one band (8K: ~64 MB per 8-bit gray, ~128 MB per 16-bit gray,
+#     ~192 MB per RGB input); size --workers accordingly for 8K sets
+# Requires numpy and Pillow (only for this stage).
+#
+# Usage:
+#   python repack_textures.py <exportFolder> [--out DIR] [--workers N] [--normal-directx] [--band-rows N]
+
+import argparse
+import json
+import os
+import re
+import shutil
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Painter output suffix (lowercased, separators removed) -> Unity-side key
+SUFFIX_TO_KEY = {
+    'basecolor': 'BaseColor', 'albedo': 'BaseColor', 'albedotransparency': 'BaseColor', 'diffuse': 'BaseColor',
+    'normal': 'Normal', 'normalopengl': 'Normal', 'normaldirectx': 'Normal',
+    'metallic': 'Metallic', 'metalness': 'Metallic',
+    'metallicsmoothness': 'MetallicSmoothness',
+    'roughness': 'Roughness',
+    'ao': 'AO', 'ambientocclusion': 'AO', 'occlusion': 'AO', 'mixedao': 'AO',
+    'emissive': 'Emission', 'emission': 'Emission',
+    'height': 'Height', 'displacement': 'Height',
+}
+
+# Unity-side key -> output file suffix (matches the Unity exporter's naming)
+KEY_TO_SUFFIX = {
+    'BaseColor': 'BaseColor',
+    'Normal': 'Normal',
+    'MetallicSmoothness': 'MetallicSmoothness',
+    'AO': 'AO',
+    'Emission': 'Emission',
+    'Height': 'Height',
+}
+
+IMAGE_EXTS = ('.png', '.tga', '.tif', '.tiff', '.jpg', '.jpeg', '.exr')
+
+DEFAULT_BAND_ROWS = 256
+
+def _import_deps():
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError as e:
+        raise RuntimeError('repack_textures requires numpy and Pillow (pip install numpy Pillow): ' + str(e))
+    return np, Image
+
+def _classify(path, ts_name):
+    """Return the Unity-side key for an exported file of ts_name, or None."""
+    stem, ext = os.path.splitext(os.path.basename(path))
+    if ext.lower() not in IMAGE_EXTS:
+        return None
+    if ts_name not in stem:
+        return None
+    tail = stem[stem.rfind(ts_name) + len(ts_name):].strip('_- .')
+    if not tail:
+        return None
+    # "<ts>_Normal_OpenGL" / "<ts>_Mixed_AO" etc. -> join remaining tokens
+    return SUFFIX_TO_KEY.get(re.sub(r'[^a-z0-9]', '', tail.lower()))
+
+def collect_exported_maps(export_folder, ts_names, manifest=None):
+    """Map each TextureSet name to {key: path}; manifest outputs win over a folder scan."""
+    out = {name: {} for name in ts_names}
+    entries = (manifest or {}).get('texture_sets') or {}
+    for name in ts_names:
+        for p in (entries.get(name) or {}).get('outputs') or {}:
+            k = _classify(p, name)
+            if k and os.path.isfile(p):
+                out[name].setdefault(k, p)
+    try:
+        files = [os.path.join(export_folder, f) for f in os.listdir(export_folder)]
+    except OSError:
+        files = []
+    # Longest names first so "Body" doesn't claim "Body_Detail_BaseColor.png"
+    for name in sorted(ts_names, key=len, reverse=True):
+        if out[name]:
+            continue
+        for p in files:
+            k = _classify(p, name)
+            if k and not any(p in m.values() for m in out.values()):
+                out[name].setdefault(k, p)
+    return out
+
+class _PngStreamWriter:
+    """Minimal 8-bit PNG encoder fed row bands, so the full output image never sits in memory."""
+
+    def __init__(self, path, width, height, channels):
+        self._f = open(path, 'wb')
+        self._z = zlib.compressobj(6)
+        self._rows = 0
+        self.height = height
+        color_type = {1: 0, 3: 2, 4: 6}[channels]
+        self._f.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+
+    def _chunk(self, tag, data):
+        self._f.write(struct.pack('>I', len(data)))
+        self._f.write(tag)
+        self._f.write(data)
+        self._f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+
+    def write_band(self, band):
+        # band: uint8 array (rows, width, channels); filter type 0 per row
+        rows = band.reshape(band.shape[0], -1)
+        raw = b''.join(b'\x00' + r.tobytes() for r in rows)
+        self._rows += band.shape[0]
+        data = self._z.compress(raw)
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        try:
+            data = self._z.flush()
+            if data:
+                self._chunk(b'IDAT', data)
+            self._chunk(b'IEND', b'')
+        finally:
+            self._f.close()
+        if self._rows != self.height:
+            raise RuntimeError(f'png_row_mismatch: wrote {self._rows} of {self.height}')
+
+def _unit_scale(im):
+    """Full-scale sample value of an image, from its mode (never from the data of one band)."""
+    if im.mode.startswith('I;16') or im.mode == 'I':
+        return 65535.0  # 16-bit PNG/TIFF load as I;16 or I
+    if im.mode == 'F':
+        return 1.0
+    return 255.0
+
+def _to_unit(np, arr, scale):
+    """Scale an integer/float array to float32 0..1 given the image's full-scale value."""
+    return np.clip(arr.astype(np.float32) * (1.0 / scale), 0.0, 1.0)
+
+def _to_u8(np, arr):
+    return (np.clip(arr, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+def _open_gray(Image, path):
+    im = Image.open(path)
+    # RGB(A) exports of gray maps: the first channel is read per band instead of a full-size convert('L')
+    if im.mode not in ('L', 'I', 'F', 'RGB', 'RGBA') and not im.mode.startswith('I;16'):
+        im = im.convert('L')
+    return im
+
+def _gray_band(np, im, box):
+    a = np.asarray(im.crop(box))
+    return a[..., 0] if a.ndim == 3 else a
+
+def _pack_metallic_smoothness(path_metal, path_rough, out_path, band_rows):
+    np, Image = _import_deps()
+    metal = _open_gray(Image, path_metal) if path_metal else None
+    rough = _open_gray(Image, path_rough) if path_rough else None
+    ref = metal or rough
+    w, h = ref.size
+    if metal is not None and rough is not None and metal.size != rough.size:
+        if rough.mode in ('RGB', 'RGBA'):
+            rough = rough.convert('L')
+        rough = rough.resize((w, h), Image.BILINEAR)
+    metal_scale = _unit_scale(metal) if metal is not None else None
+    rough_scale = _unit_scale(rough) if rough is not None else None
+    writer = _PngStreamWriter(out_path, w, h, 4)
+    try:
+        for y0 in range(0, h, band_rows):
+            y1 = min(h, y0 + band_rows)
+            box = (0, y0, w, y1)
+            band = np.zeros((y1 - y0, w, 4), dtype=np.float32)
+            if metal is not None:
+                band[..., 0] = _to_unit(np, _gray_band(np, metal, box), metal_scale)
+            if rough is not None:
+                band[..., 3] = 1.0 - _to_unit(np, _gray_band(np, rough, box), rough_scale)
+            else:
+                band[..., 3] = 0.5  # Unity's default _Glossiness
+            writer.write_band(_to_u8(np, band))
+    finally:
+        writer.close()
+    return out_path
+
+def _convert_normal(path, out_path, flip_green, band_rows):
+    np, Image = _import_deps()
+    im = Image.open(path)
+    if not flip_green and im.mode == 'RGB' and path.lower().endswith('.png'):
+        shutil.copyfile(path, out_path)
+        return out_path
+    if im.mode != 'RGB':
+        im = im.convert('RGB')
+    w, h = im.size
+    writer = _PngStreamWriter(out_path, w, h, 3)
+    try:
+        for y0 in range(0, h, band_rows):
+            band = np.array(im.crop((0, y0, w, min(h, y0 + band_rows))), dtype=np.uint8)
+            if flip_green:
+                band[..., 1] = 255 - band[..., 1]
+            writer.write_band(band)
+    finally:
+        writer.close()
+    return out_path
+
+def _copy_as_png(path, out_path):
+    if path.lower().endswith('.png'):
+        shutil.copyfile(path, out_path)
+        return out_path
+    _, Image = _import_deps()
+    Image.open(path).save(out_path, 'PNG')
+    return out_path
+
+def repack_texture_set(ts_name, maps, out_dir, normal_directx=False, band_rows=DEFAULT_BAND_ROWS):
+    """Repack one TextureSet's exported maps into Unity slot files. Runs in a worker process."""
+    os.makedirs(out_dir, exist_ok=True)
+    result = {'textureset': ts_name, 'outputs': {}, 'errors': []}
+
+    def out_path(key):
+        return os.path.join(out_dir, f'{ts_name}_{KEY_TO_SUFFIX[key]}.png')
+
+    steps = []
+    if maps.get('MetallicSmoothness'):
+        steps.append(('MetallicSmoothness', lambda: _copy_as_png(maps['MetallicSmoothness'], out_path('MetallicSmoothness'))))
+    elif maps.get('Metallic') or maps.get('Roughness'):
+        steps.append(('MetallicSmoothness', lambda: _pack_metallic_smoothness(
+            maps.get('Metallic'), maps.get('Roughness'), out_path('MetallicSmoothness'), band_rows)))
+    if maps.get('Normal'):
+        steps.append(('Normal', lambda: _convert_normal(maps['Normal'], out_path('Normal'), normal_directx, band_rows)))
+    for key in ('BaseColor', 'AO', 'Emission', 'Height'):
+        if maps.get(key):
+            steps.append((key, lambda key=key: _copy_as_png(maps[key], out_path(key))))
+
+    for key, fn in steps:
+        try:
+            result['outputs'][key] = fn()
+        except Exception as e:
+            result['errors'].append(f'{key}: {type(e).__name__}: {e}')
+    return result
+
+def repack_export(export_folder, ts_names, out_dir=None, workers=None, normal_directx=False,
+                  band_rows=DEFAULT_BAND_ROWS, log=None):
+    """Repack every TextureSet in parallel; returns the per-set results list."""
+    _import_deps()  # fail fast in the parent rather than once per worker
+    out_dir = out_dir or os.path.join(export_folder, 'unity')
+    manifest = None
+    try:
+        with open(os.path.join(export_folder, 'painter_export_manifest.json'), 'r', encoding='utf-8-sig') as f:
+            manifest = json.load(f)
+    except Exception:
+        pass
+    found = collect_exported_maps(export_folder, ts_names, manifest)
+    jobs = [(name, maps) for name, maps in found.items() if maps]
+    for name, maps in found.items():
+        if not maps and log:
+            log(f'[repack] {name}: no exported maps found')
+    if not jobs:
+        return []
+    workers = max(1, min(len(jobs), workers or os.cpu_count() or 1))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futs = {pool.submit(repack_texture_set, name, maps, out_dir, normal_directx, band_rows): name
+                for name, maps in jobs}
+        for fut in as_completed(futs):
+            try:
+                r = fut.result()
+            except Exception as e:
+                r = {'textureset': futs[fut], 'outputs': {}, 'errors': [f'{type(e).__name__}: {e}']}
+            results.append(r)
+            if log:
+                log(f"[repack] {r['textureset']}: {sorted(r['outputs'])} errors={len(r['errors'])}")
+    return results
+
+def _scan_ts_names(export_folder):
+    """Guess TextureSet names from '<ts>_<Suffix>.<ext>' files (CLI use without a job)."""
+    names = set()
+    for f in os.listdir(export_folder):
+        stem, ext = os.path.splitext(f)
+        if ext.lower() not in IMAGE_EXTS or '_' not in stem:
+            continue
+        parts = stem.split('_')
+        for i in range(len(parts) - 1, 0, -1):
+            if re.sub(r'[^a-z0-9]', '', ''.join(parts[i:]).lower()) in SUFFIX_TO_KEY:
+                names.add('_'.join(parts[:i]))
+                break
+    return sorted(names)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Repack Painter exports into Unity Standard (Metallic) textures.')
+    ap.add_argument('export_folder')
+    ap.add_argument('--textureset', action='append', default=[], help='TextureSet name (repeatable); default: scan folder')
+    ap.add_argument('--out', default=None, help='Output folder (default: <export_folder>/unity)')
+    ap.add_argument('--workers', type=int, default=None)
+    ap.add_argument('--normal-directx', action='store_true', help='Exported normals are DirectX (flip green)')
+    ap.add_argument('--band-rows', type=int, default=DEFAULT_BAND_ROWS)
+    args = ap.parse_args(argv)
+    names = args.textureset or _scan_ts_names(args.export_folder)
+    results = repack_export(args.export_folder, names, args.out, args.workers, args.normal_directx,
+                            args.band_rows, log=lambda m: print(m, flush=True))
+    print(json.dumps(results, ensure_ascii=False, indent=2), flush=True)
+    return 1 if any(r['errors'] for r in results) else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
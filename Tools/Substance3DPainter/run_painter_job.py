@@ -7,17 +7,58 @@
 #   - [FIX] _wait_remote now logs retry progress every 10 seconds
 #   - [FIX] Detects already-running Painter to avoid port conflict
 #   - [FIX] Unhandled exceptions in main() logged to log file (not just stdout)
+#   - Export stage: all stale TextureSets exported in one export_project_textures() call,
+#     skipped when painter_export_manifest.json (output hashes + layer-stack fingerprint) is current
+#   - Painter-side state store (TTL + max-entry eviction) for job states, cached ResourceIDs and
+#     bootstrap data; job state released after use, state_status query logs active jobs / store size
+#   - Painter process CPU/RSS sampled per phase into painter_run_metrics.json; Painter is closed /
+#     restarted between jobs once recycleMaxRssMB or recycleMaxJobs is reached
+#   - Write-ahead checkpoint journal (painter_job_journal.jsonl): a rerun resumes from the first
+#     incomplete step after validating job/mesh/spp hashes and the Painter session
+#   - Apply runs as a background job in Painter (one main-thread step per texture); the runner polls
+#     per-texture progress and persists it to painter_apply_<TextureSetName>_PROGRESS.json
+#   - --profile (or job.json "profile": true): cProfile + tracemalloc + process sampling of the runner,
+#     and per-call remote timing split into build / wrap / encode / HTTP / parse
+#   - Fill layers are tagged "Unity Import: <TextureSet>" and updated in place on rerun: unchanged
+#     sources are kept, stale tagged fills and unreferenced resources are removed
+#   - Shared texture library: textures flagged "shared" or repeated across the batch (by content hash)
+#     are imported once into a library shelf and resolved through a persistent hash -> resource index
+#   - Local staging cache (lib_staging.py): mesh and textures copied in parallel into a content-addressed
+#     cache while Painter starts, job paths rewritten to the staged copies; size cap with LRU eviction
+#   - project.create settings from job.json (documentResolution, normalMapFormat, projectWorkflow / useUDIM,
+#     tangentSpace, templateSptPath); "auto" resolution picks a tier per TextureSet from its largest texture
+#   - perf_counter spans inside the remote apply (TextureSet lookup, channels, insert_fill, each import /
+#     ResourceID conversion / set_source), merged with file size + pixel count into the log and metrics
+#   - --plan dry run: texture sets, channel mapping, deduplicated imports and bytes, plus per-phase time
+#     estimates from a cost model (lib_costmodel.py) fitted on painter_cost_history.jsonl
+#   - Variants: job.json "variants" list named texture-map sets for the same mesh; the project is created
+#     once and each variant is applied, saved as <spp>_<variant>.spp and optionally exported
+#   - Optional repack of exported maps into Unity Standard slots (repack_textures.py, numpy + Pillow)
 # For Adobe Substance 3D Painter 11.0+ (Steam/Standalone) with --enable-remote-scripting
 #
 # Usage:
-#   python run_painter_job.py path\to\job.json
+#   python run_painter_job.py path\to\job.json [--profile]
+#   python run_painter_job.py path\to\job.json --plan     (dry run: planned work + time estimate, no Painter)
 #
+# Outputs under sharedLibraryFolder (when set):
+#   painter_shared_index.json
 # Outputs under exportFolder:
 #   job_runner.local.log
 #   painter_remote_apply.log
 #   painter_apply_<TextureSetName>_RAW.txt
 #   painter_apply_<TextureSetName>_Fixed16.15.0.json
-
+#   painter_apply_<TextureSetName>_PROGRESS.json
+#   painter_export_Fixed16.15.0.json
+#   painter_export_manifest.json
+#   painter_run_metrics.json
+#   painter_job_journal.jsonl
+#   runner_profile.prof / runner_profile_top.txt / runner_alloc_top.txt / runner_profile.json (--profile)
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import copy
+import functools
 import json
 import os
 import sys
@@ -25,7 +66,11 @@ import time
 import subprocess
 import traceback
 
+import lib_costmodel
+import lib_image
+import lib_process
 import lib_remote
+import lib_staging
 
 VERSION = "Fixed16.15.0"
 
@@ -57,13 +102,59 @@ def _wrap_block_to_expression(block: str) -> str:
     blk = _py_escape_triple(block)
     return "(lambda g: (exec('''%s''', g), g.get('OUT',''))[1])({})" % blk
 
+# Per-call remote profile (--profile / job.json "profile"); None when profiling is off.
+_CALL_PROFILE = None
+
+def _profiled_build(fn):
+    """Charge time spent in a remote block builder to the next _remote_exec_block call."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        prof = _CALL_PROFILE
+        if prof is None:
+            return fn(*args, **kwargs)
+        prof['depth'] += 1
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            prof['depth'] -= 1
+            if prof['depth'] == 0:
+                prof['pending_build_sec'] += time.perf_counter() - t0
+    return wrapper
+
+def _profile_remote_call(label, block, wrap_sec, remote, ok):
+    prof = _CALL_PROFILE
+    if prof is None:
+        return
+    timing = dict(getattr(remote, 'last_timing', None) or {})
+    prof['calls'].append({
+        'label': label,
+        'ok': ok,
+        'block_chars': len(block),
+        'build_sec': round(prof['pending_build_sec'], 6),
+        'wrap_sec': round(wrap_sec, 6),
+        'encode_sec': round(timing.get('encode_sec', 0.0), 6),
+        'http_sec': round(timing.get('http_sec', 0.0), 6),
+        'bytes_sent': timing.get('bytes_sent'),
+        'bytes_recv': timing.get('bytes_recv'),
+        'parse_sec': 0.0,
+        'parse_calls': 0,
+        'double_decoded': False,
+    })
+    prof['pending_build_sec'] = 0.0
+
 def _remote_exec_block(remote, block, label, local_log, timeout=1200):
     _log(local_log, f'[remote] exec {label}')
+    t0 = time.perf_counter()
+    expr = _wrap_block_to_expression(block)
+    wrap_sec = time.perf_counter() - t0
     try:
-        res = remote.execScript(_wrap_block_to_expression(block), 'python', timeout=timeout)
+        res = remote.execScript(expr, 'python', timeout=timeout)
+        _profile_remote_call(label, block, wrap_sec, remote, True)
         _log(local_log, f'[remote] OK {label} (return_len={len(res) if isinstance(res,str) else "n/a"})')
         return res
     except Exception as e:
+        _profile_remote_call(label, block, wrap_sec, remote, False)
         # Return a JSON error object so caller can log/abort gracefully (prevents "logs stop at 2 files" syndrome).
         _log(local_log, f'[remote] NG {label}: {e}')
         return json.dumps({
@@ -134,7 +225,7 @@ def _start_painter(exe_path, spp_path, local_log):
     if spp_path and os.path.exists(spp_path):
         args.append(spp_path)
     _log(local_log, f'[spawn] {args}')
-    subprocess.Popen(args, cwd=os.path.dirname(exe_path))
+    return subprocess.Popen(args, cwd=os.path.dirname(exe_path))
 
 def _extract_texture_sets(job):
     tsets = job.get('textureSets') or []
@@ -160,6 +251,20 @@ def _extract_texture_sets(job):
     return out
 
 def _normalize_remote_json(res):
+    prof = _CALL_PROFILE
+    if prof is None:
+        return _decode_remote_json(res)
+    t0 = time.perf_counter()
+    obj = _decode_remote_json(res)
+    if prof['calls']:
+        call = prof['calls'][-1]
+        call['parse_sec'] = round(call['parse_sec'] + time.perf_counter() - t0, 6)
+        call['parse_calls'] += 1
+        # run.json wraps OUT in a JSON string, which is decoded a second time
+        call['double_decoded'] = call['double_decoded'] or (isinstance(res, str) and res.lstrip().startswith('"'))
+    return obj
+
+def _decode_remote_json(res):
     if res is None:
         return None
     s = res if isinstance(res, str) else str(res)
@@ -176,6 +281,94 @@ def _normalize_remote_json(res):
             return {'_raw_string': obj}
     return obj
 
+STATE_STORE_TTL_SEC = 3600.0
+STATE_STORE_MAX_ENTRIES = 256
+
+# Prepended to every block that touches per-session state. One store on the
+# application module holds job states, cached ResourceIDs and bootstrap data
+# under a single TTL / max-entry eviction policy. Running jobs are never
+# expired by TTL.
+REMOTE_STATE_STORE = r'''import time, threading
+import substance_painter.application as app
+
+class _UnityStateStore(object):
+    VERSION = 1
+
+    def __init__(self, ttl, max_entries):
+        self._lock = threading.RLock()
+        self._items = {}
+        self.evicted = 0
+        self.configure(ttl, max_entries)
+
+    def configure(self, ttl, max_entries):
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+
+    def _active(self, kind, value):
+        return kind == "job" and isinstance(value, dict) and value.get("status") == "running"
+
+    def evict(self):
+        with self._lock:
+            now = time.time()
+            for k, e in list(self._items.items()):
+                if self.ttl > 0 and now - e[2] > self.ttl and not self._active(k[0], e[0]):
+                    del self._items[k]
+                    self.evicted += 1
+            if len(self._items) > self.max_entries:
+                order = sorted(self._items.items(), key=lambda kv: (self._active(kv[0][0], kv[1][0]), kv[1][2]))
+                for k, _ in order[:len(self._items) - self.max_entries]:
+                    del self._items[k]
+                    self.evicted += 1
+
+    def put(self, kind, key, value):
+        with self._lock:
+            now = time.time()
+            self._items[(kind, key)] = [value, now, now]
+            self.evict()
+        return value
+
+    def get(self, kind, key, default=None):
+        with self._lock:
+            self.evict()
+            e = self._items.get((kind, key))
+            if e is None:
+                return default
+            e[2] = time.time()
+            return e[0]
+
+    def pop(self, kind, key, default=None):
+        with self._lock:
+            e = self._items.pop((kind, key), None)
+            return default if e is None else e[0]
+
+    def items(self, kind):
+        with self._lock:
+            self.evict()
+            return [(k[1], e[0]) for k, e in self._items.items() if k[0] == kind]
+
+    def stats(self):
+        with self._lock:
+            by_kind = {}
+            for k in self._items:
+                by_kind[k[0]] = by_kind.get(k[0], 0) + 1
+            return {"size": len(self._items), "by_kind": by_kind, "max_entries": self.max_entries,
+                    "ttl_sec": self.ttl, "evicted_total": self.evicted}
+
+STORE = getattr(app, "_unity_state_store", None)
+if STORE is None or getattr(STORE, "VERSION", 0) != _UnityStateStore.VERSION:
+    STORE = _UnityStateStore(__STORE_TTL__, __STORE_MAX__)
+    app._unity_state_store = STORE
+elif __STORE_CONFIGURE__:
+    STORE.configure(__STORE_TTL__, __STORE_MAX__)
+if hasattr(app, "_unity_job_state"):
+    # unbounded per-run dict from older runners
+    del app._unity_job_state
+# per-session values that must outlive store eviction (recycle counter, journal session id)
+SESSION = getattr(app, "_unity_session", None)
+if SESSION is None:
+    SESSION = app._unity_session = {}
+'''
+
 REMOTE_ENSURE_PROJECT_ASYNC_START = r'''
 import json, os, time, traceback, threading
 import substance_painter.application as app
@@ -212,12 +405,48 @@ SPP  = _norm(OUT_OBJ['outputProjectPath'])
 OUT_OBJ['meshPath_norm'] = MESH
 OUT_OBJ['outputProjectPath_norm'] = SPP
 
+# project.create settings from job.json; enum values are given by member name
+SETTINGS = __SETTINGS_JSON__
+TEMPLATE = _norm(SETTINGS.pop('template_file_path', None))
+OUT_OBJ['settings'] = dict(SETTINGS)
+_ENUMS = {'normal_map_format': 'NormalMapFormat', 'project_workflow': 'ProjectWorkflow', 'tangent_space_mode': 'TangentSpace'}
+CREATE_KW = {}
+if TEMPLATE:
+  CREATE_KW['template_file_path'] = TEMPLATE
+OUT_OBJ['settings_applied'] = {}
+
+def _setting_value(k, v):
+  if k not in _ENUMS:
+    return v
+  enum = getattr(project, _ENUMS[k])
+  if hasattr(enum, v):
+    return getattr(enum, v)
+  # "OpenGl" -> OpenGL
+  for _m in dir(enum):
+    if not _m.startswith('_') and _m.lower() == str(v).lower():
+      return getattr(enum, _m)
+  raise ValueError('%s: unknown %s member %r' % (k, _ENUMS[k], v))
+
+# each key on its own, so one bad value does not drop the others (resolution included)
+_kw = {}
+for _k, _v in SETTINGS.items():
+  try:
+    _val = _setting_value(_k, _v)
+    project.Settings(**dict(_kw, **{_k: _val}))
+    _kw[_k] = _val
+    OUT_OBJ['settings_applied'][_k] = _v
+  except Exception as e:
+    OUT_OBJ['errors'].append('project_setting_failed: %s=%r: %r' % (_k, _v, e))
+if _kw:
+  try:
+    CREATE_KW['settings'] = project.Settings(**_kw)
+  except Exception as e:
+    OUT_OBJ['settings_applied'] = {}
+    OUT_OBJ['errors'].append('project_settings_failed: ' + repr(e))
+
 job_id = str(int(time.time()*1000))
 OUT_OBJ['job_id'] = job_id
 
-if not hasattr(app, '_unity_job_state'):
-  app._unity_job_state = {}
-
 state = {
   'job_id': job_id,
   'status': 'running',
@@ -229,7 +458,10 @@ state = {
   'trace': None,
 }
 
-app._unity_job_state[job_id] = state
+STORE.put('job', job_id, state)
+# jobs served by this Painter session, read by the runner's recycle policy
+SESSION['jobs_served'] = int(SESSION.get('jobs_served') or 0) + 1
+OUT_OBJ['jobs_served'] = SESSION['jobs_served']
 
 def _set(step, status=None):
   state['step'] = step
@@ -244,9 +476,9 @@ def _worker_create_only():
       raise RuntimeError('mesh_missing_or_not_found')
     _set('create_begin')
     try:
-      project.create(MESH)
+      project.create(MESH, **CREATE_KW)
     except TypeError:
-      project.create(mesh_file_path=MESH)
+      project.create(mesh_file_path=MESH, **CREATE_KW)
     _set('create_done', status='ready_for_save')
   except Exception as e:
     _set('error', status='error')
@@ -267,9 +499,7 @@ REMOTE_ENSURE_PROJECT_ASYNC_POLL = r'''
 import json
 import substance_painter.application as app
 job_id = r"__JOB_ID__"
-st = None
-if hasattr(app, '_unity_job_state'):
-  st = app._unity_job_state.get(job_id)
+st = STORE.get('job', job_id)
 OUT = json.dumps(st, ensure_ascii=False)
 
 '''
@@ -288,9 +518,7 @@ reopen_delay = float("__REOPEN_DELAY__")
 OUT_OBJ = {'job_id': job_id, 'status': None, 'step': None, 'error': None}
 
 try:
-  st = None
-  if hasattr(app, '_unity_job_state'):
-    st = app._unity_job_state.get(job_id)
+  st = STORE.get('job', job_id)
   if not st:
     raise RuntimeError('job_state_missing')
   if st.get('status') != 'ready_for_save':
@@ -338,7 +566,240 @@ OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
 
 '''
 
-REMOTE_APPLY_TEMPLATE = r'''import json, os, time, traceback
+REMOTE_STATE_RELEASE = r'''
+import json
+job_id = r"__JOB_ID__"
+released = STORE.pop('job', job_id) is not None
+OUT = json.dumps({'job_id': job_id, 'released': released, 'store': STORE.stats()}, ensure_ascii=False)
+'''
+
+REMOTE_STATE_STATUS = r'''
+import json
+now = time.time()
+jobs = []
+for jid, st in STORE.items('job'):
+  if isinstance(st, dict):
+    jobs.append({'job_id': jid, 'status': st.get('status'), 'step': st.get('step'), 'age_sec': round(now - float(st.get('ts') or now), 1)})
+OUT = json.dumps({'active_jobs': [j for j in jobs if j['status'] == 'running'], 'jobs': jobs,
+                  'jobs_served': int(SESSION.get('jobs_served') or 0), 'store': STORE.stats()}, ensure_ascii=False)
+'''
+
+# Graceful shutdown for the recycle policy. The HTTP reply may never arrive
+# once close_painter() runs, so callers treat a remote error as expected.
+REMOTE_CLOSE_PAINTER = r'''
+import json
+OUT_OBJ = {'closed_project': False, 'close_requested': False, 'errors': []}
+try:
+  import substance_painter.project as project
+  if project.is_open():
+    project.close()
+    OUT_OBJ['closed_project'] = True
+except Exception as e:
+  OUT_OBJ['errors'].append('project_close_failed: ' + str(e))
+try:
+  import substance_painter.application as app
+  app.close_painter()
+  OUT_OBJ['close_requested'] = True
+except Exception as e:
+  OUT_OBJ['errors'].append('close_painter_failed: ' + str(e))
+OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+'''
+
+# Identity of the running Painter session and its open project; the
+# checkpoint journal only trusts in-memory work done in the same session.
+REMOTE_PROJECT_STATE = r'''
+import json, uuid
+OUT_OBJ = {'session_id': None, 'is_open': False, 'file_path': None, 'errors': []}
+sid = SESSION.get('session_id')
+if sid is None:
+  sid = SESSION['session_id'] = uuid.uuid4().hex
+OUT_OBJ['session_id'] = sid
+try:
+  import substance_painter.project as project
+  OUT_OBJ['is_open'] = bool(project.is_open())
+  if OUT_OBJ['is_open']:
+    OUT_OBJ['file_path'] = project.file_path()
+except Exception as e:
+  OUT_OBJ['errors'].append('project_state_failed: ' + str(e))
+OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+'''
+
+REMOTE_OPEN_PROJECT = r'''
+import json, traceback
+spp = r"__SPP__"
+OUT_OBJ = {'opened': False, 'error': None}
+try:
+  import substance_painter.project as project
+  if project.is_open():
+    project.close()
+  project.open(spp)
+  OUT_OBJ['opened'] = True
+except Exception as e:
+  OUT_OBJ['error'] = repr(e)
+  OUT_OBJ['trace'] = traceback.format_exc()
+OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+'''
+
+# Saves the open project under a new path (variants), without close/reopen.
+REMOTE_SAVE_AS = r'''
+import json, os, traceback
+spp = r"__SPP__"
+OUT_OBJ = {'saved': False, 'spp': spp, 'error': None}
+try:
+  import substance_painter.project as project
+  d = os.path.dirname(spp)
+  if d and not os.path.exists(d):
+    os.makedirs(d, exist_ok=True)
+  project.save_as(spp)
+  OUT_OBJ['saved'] = True
+except Exception as e:
+  OUT_OBJ['error'] = repr(e)
+  OUT_OBJ['trace'] = traceback.format_exc()
+OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+'''
+
+REMOTE_WAIT_TEXTURESETS = r'''
+import json, time
+OUT_OBJ={'_version':'__VERSION__','_ts':int(time.time()),'tries':[],'ok':False,'count':0,'names':[]}
+try:
+  import substance_painter.textureset as textureset
+except Exception as e:
+  OUT_OBJ['tries'].append({'i':0,'err':'import_failed:'+str(e)})
+  OUT=json.dumps(OUT_OBJ, ensure_ascii=False)
+else:
+  for i in range(20):
+    try:
+      ts=list(textureset.all_texture_sets())
+      names=[]
+      for t in ts:
+        try: names.append(t.name())
+        except Exception: names.append(str(t))
+      OUT_OBJ['tries'].append({'i':i,'count':len(ts),'names':names})
+      if len(ts)>0:
+        OUT_OBJ['ok']=True; OUT_OBJ['count']=len(ts); OUT_OBJ['names']=names
+        break
+    except Exception as e:
+      OUT_OBJ['tries'].append({'i':i,'err':str(e)})
+    time.sleep(0.5)
+  OUT=json.dumps(OUT_OBJ, ensure_ascii=False)
+'''
+
+# Name given to the fill layer this tool creates; a rerun updates that layer in place.
+FILL_TAG_PREFIX = 'Unity Import: '
+
+# Shared by the apply and fill-cleanup blocks: the fill record in project metadata and
+# removal of project resources no fill references any more. Expects OUT_OBJ["attempts"].
+REMOTE_FILL_META_COMMON = r'''
+# Per-TextureSet record of the tagged fill: {"uid", "sources": {key: {"sig", "resource", "channel"}}}.
+# Kept in project metadata so it survives save/reopen; the state store is the fallback.
+def _fill_meta_load():
+    try:
+        import substance_painter.project as project
+        return dict(project.Metadata("UnityBridge").get("fills") or {})
+    except Exception:
+        return dict(STORE.get("bootstrap", "fills") or {})
+
+def _fill_meta_save(meta):
+    try:
+        import substance_painter.project as project
+        project.Metadata("UnityBridge").set("fills", meta)
+    except Exception as e:
+        OUT_OBJ["attempts"].append({"step":"project.Metadata.set","ok":False,"err":str(e)})
+        STORE.put("bootstrap", "fills", meta)
+
+def _remove_unreferenced_resources(urls):
+    """Best-effort removal of project resources no fill references any more."""
+    removed = []
+    try:
+        import substance_painter.resource as resmod
+    except Exception:
+        return removed
+    for url in urls:
+        try:
+            rid = resmod.ResourceID.from_url(url)
+        except Exception as e:
+            OUT_OBJ["attempts"].append({"step":"ResourceID.from_url","ok":False,"url":url,"err":str(e)})
+            continue
+        done = False
+        for _fn in ("remove_project_resource", "delete_project_resource"):
+            if not done and hasattr(resmod, _fn):
+                try:
+                    getattr(resmod, _fn)(rid)
+                    done = True
+                except Exception as e:
+                    OUT_OBJ["attempts"].append({"step":"resource."+_fn,"ok":False,"url":url,"err":str(e)})
+        if not done:
+            try:
+                for _r in resmod.Resource.retrieve(rid) or []:
+                    for _m in ("remove", "delete"):
+                        if hasattr(_r, _m):
+                            getattr(_r, _m)()
+                            done = True
+                            break
+            except Exception as e:
+                OUT_OBJ["attempts"].append({"step":"Resource.remove","ok":False,"url":url,"err":str(e)})
+        if done:
+            removed.append(url)
+    return removed
+'''
+
+# Removes tagged fills from TextureSets the job no longer lists, with their fill records and
+# the (non-shared) resources only those fills referenced.
+REMOTE_FILL_CLEANUP = r'''
+import json
+KEEP = __KEEP_JSON__
+OUT_OBJ = {'removed': [], 'errors': [], 'attempts': []}
+__FILL_META_COMMON__
+try:
+  import substance_painter.textureset as textureset
+  import substance_painter.layerstack as ls
+  for t in textureset.all_texture_sets():
+    if t.name() in KEEP:
+      continue
+    for stack in t.all_stacks():
+      for n in ls.get_root_layer_nodes(stack):
+        try:
+          if n.get_name().startswith("__FILL_TAG_PREFIX__"):
+            ls.delete_node(n)
+            OUT_OBJ['removed'].append(t.name())
+        except Exception as e:
+          OUT_OBJ['errors'].append(str(e))
+except Exception as e:
+  OUT_OBJ['errors'].append('cleanup_failed: ' + str(e))
+try:
+  meta = _fill_meta_load()
+  dropped = [n for n in meta if n not in KEEP]
+  if dropped:
+    urls = []
+    for n in dropped:
+      for src in ((meta.pop(n) or {}).get('sources') or {}).values():
+        if src.get('resource') and not src.get('shared'):
+          urls.append(src.get('resource'))
+    _fill_meta_save(meta)
+    OUT_OBJ['records_removed'] = dropped
+    referenced = set()
+    for rec in meta.values():
+      for src in ((rec or {}).get('sources') or {}).values():
+        referenced.add(src.get('resource'))
+    stale = sorted(set(u for u in urls if u not in referenced))
+    if stale:
+      OUT_OBJ['resources_unreferenced'] = stale
+      OUT_OBJ['resources_removed'] = _remove_unreferenced_resources(stale)
+except Exception as e:
+  OUT_OBJ['errors'].append('fill_records_cleanup_failed: ' + str(e))
+OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+'''
+
+REMOTE_JOB_CANCEL = r'''
+import json
+job_id = r"__JOB_ID__"
+st = STORE.get('job', job_id)
+if isinstance(st, dict):
+  st['cancel'] = True
+OUT = json.dumps({'job_id': job_id, 'found': isinstance(st, dict)}, ensure_ascii=False)
+'''
+
+REMOTE_APPLY_TEMPLATE = r'''import json, os, time, traceback, threading
 
 OUT_OBJ = {
   "_version": "__VERSION__",
@@ -358,511 +819,1390 @@ OUT_OBJ = {
 
 KEY_TO_PATH = __KEY_TO_PATH_JSON__
 OUT_OBJ["keys"] = list(KEY_TO_PATH.keys())
+# path -> {"hash", "url", "shelf", "folder"} for textures resolved through the shared library
+SHARED = __SHARED_JSON__
+TS_RESOLUTION = __TS_RESOLUTION__
+
+# perf_counter spans, compact rows [step, key, start_ms, dur_ms] relative to block start
+_T0 = time.perf_counter()
+OUT_OBJ["spans"] = []
+def _span(step, t0, key=None):
+    OUT_OBJ["spans"].append([step, key, round((t0 - _T0) * 1000.0, 2), round((time.perf_counter() - t0) * 1000.0, 2)])
+
+# --- setup: locate TextureSet & Stack, add channels, insert the fill layer ---
+CTX = {}
+FILL_TAG = "__FILL_TAG_PREFIX__" + OUT_OBJ["textureset"]
+
+__FILL_META_COMMON__
+def _file_sig(path):
+    try:
+        _st = os.stat(path)
+        return str(_st.st_mtime_ns) + ":" + str(_st.st_size)
+    except Exception:
+        return None
 
-# --- locate TextureSet & Stack ---
-try:
-    import substance_painter.textureset as textureset
-    import substance_painter.layerstack as ls
-except Exception as e:
-    OUT_OBJ["errors"].append("import_modules_failed: " + str(e))
-    OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
-else:
-    ts = None
+def _finalize_fill(status):
+    """Persist the fill record; once the run is done, drop channels no longer in the job and release replaced resources."""
+    fill = CTX.get("fill")
+    if fill is None:
+        return
+    pick_channel = CTX["pick_channel"]
+    prev_sources = CTX["prev_sources"]
+    # keys not reached (cancel/timeout) or not rebound (missing file, failed import) keep their previous source
+    sources = dict(CTX["new_sources"])
+    for k in KEY_TO_PATH:
+        if k not in sources and k in prev_sources:
+            sources[k] = prev_sources[k]
+    replaced = list(CTX["replaced"])
+    if status == "done":
+        for k, _src in prev_sources.items():
+            if k not in KEY_TO_PATH and _src.get("resource") and not _src.get("shared"):
+                replaced.append(_src.get("resource"))
+        if CTX.get("fill_reused"):
+            try:
+                _keep = set()
+                for k in KEY_TO_PATH:
+                    _ch = pick_channel(k) if CTX["CT"] is not None else None
+                    if _ch is not None:
+                        _keep.add(str(_ch))
+                _chans = set(fill.active_channels)
+                _drop = [c for c in _chans if str(c) not in _keep]
+                if _drop:
+                    fill.active_channels = set(c for c in _chans if str(c) in _keep)
+                    OUT_OBJ["channels_dropped"] = [str(c) for c in _drop]
+            except Exception as e:
+                OUT_OBJ["attempts"].append({"step":"fill.active_channels","ok":False,"err":str(e)})
+    meta = _fill_meta_load()
     try:
-        for t in textureset.all_texture_sets():
-            if t.name() == OUT_OBJ["textureset"]:
-                ts = t
-                break
+        _uid = fill.uid()
+    except Exception:
+        _uid = None
+    meta[OUT_OBJ["textureset"]] = {"uid": _uid, "sources": sources}
+    _fill_meta_save(meta)
+    if status != "done":
+        return
+    # replaced resources still referenced by another TextureSet's fill stay
+    referenced = set()
+    for _rec in meta.values():
+        for _src in ((_rec or {}).get("sources") or {}).values():
+            referenced.add(_src.get("resource"))
+    stale = [u for u in replaced if u and u not in referenced]
+    if stale:
+        OUT_OBJ["resources_removed"] = _remove_unreferenced_resources(stale)
+        OUT_OBJ["resources_unreferenced"] = stale
+
+def _setup():
+    try:
+        import substance_painter.textureset as textureset
+        import substance_painter.layerstack as ls
     except Exception as e:
-        OUT_OBJ["errors"].append("all_texture_sets_failed: " + str(e))
-
-    if ts is None:
-        OUT_OBJ["errors"].append("TextureSet not found")
-        OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+        OUT_OBJ["errors"].append("import_modules_failed: " + str(e))
+        return False
     else:
-        stack = None
+        _s = time.perf_counter()
+        ts = None
         try:
-            if hasattr(ts, "all_stacks"):
-                st = ts.all_stacks()
-                if st:
-                    stack = list(st)[0]
-                    OUT_OBJ["attempts"].append({"step":"ts.all_stacks","ok":True,"count":len(list(st))})
+            for t in textureset.all_texture_sets():
+                if t.name() == OUT_OBJ["textureset"]:
+                    ts = t
+                    break
         except Exception as e:
-            OUT_OBJ["attempts"].append({"step":"ts.all_stacks","ok":False,"err":str(e)})
-
-        if stack is None:
-            try:
-                if hasattr(ts, "get_stack"):
-                    stack = ts.get_stack()
-                    OUT_OBJ["attempts"].append({"step":"ts.get_stack()","ok":True,"type":str(type(stack))})
-            except Exception as e:
-                OUT_OBJ["attempts"].append({"step":"ts.get_stack()","ok":False,"err":str(e)})
+            OUT_OBJ["errors"].append("all_texture_sets_failed: " + str(e))
+        _span("ts_lookup", _s)
 
-        if stack is None:
-            OUT_OBJ["errors"].append("No stack obtained from TextureSet")
-            OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+        if ts is None:
+            OUT_OBJ["errors"].append("TextureSet not found")
+            return False
         else:
-            OUT_OBJ["stack"] = {"type": str(type(stack)), "repr": str(stack)}
-
-            roots = []
-            try:
-                roots = ls.get_root_layer_nodes(stack)
-                OUT_OBJ["roots"] = [{"type": str(type(r)), "repr": str(r)} for r in roots]
-            except Exception as e:
-                OUT_OBJ["errors"].append("get_root_layer_nodes_failed: " + str(e))
-
-            # --- ChannelType discovery ---
-            CT = None
+            # resolution tier picked from this set's largest input texture
+            if TS_RESOLUTION:
+                try:
+                    _r = ts.get_resolution()
+                    if (_r.width, _r.height) != (TS_RESOLUTION, TS_RESOLUTION):
+                        _s = time.perf_counter()
+                        ts.set_resolution(textureset.Resolution(TS_RESOLUTION, TS_RESOLUTION))
+                        _span("set_resolution", _s)
+                        OUT_OBJ["resolution_set"] = [TS_RESOLUTION, TS_RESOLUTION]
+                except Exception as e:
+                    OUT_OBJ["attempts"].append({"step":"ts.set_resolution","ok":False,"err":str(e)})
+            stack = None
             try:
-                if hasattr(textureset, "ChannelType"):
-                    CT = textureset.ChannelType
-                elif hasattr(textureset, "Channel"):
-                    CT = textureset.Channel
+                if hasattr(ts, "all_stacks"):
+                    st = ts.all_stacks()
+                    if st:
+                        stack = list(st)[0]
+                        OUT_OBJ["attempts"].append({"step":"ts.all_stacks","ok":True,"count":len(list(st))})
             except Exception as e:
-                OUT_OBJ["errors"].append("ChannelType_discovery_failed: " + str(e))
+                OUT_OBJ["attempts"].append({"step":"ts.all_stacks","ok":False,"err":str(e)})
 
-            lower_to_member = {}
-            if CT is not None:
+            if stack is None:
                 try:
-                    for _nm in dir(CT):
-                        if _nm.startswith("_"):
-                            continue
-                        OUT_OBJ["channeltype_members"].append(_nm)
-                        lower_to_member[_nm.lower()] = _nm
+                    if hasattr(ts, "get_stack"):
+                        stack = ts.get_stack()
+                        OUT_OBJ["attempts"].append({"step":"ts.get_stack()","ok":True,"type":str(type(stack))})
                 except Exception as e:
-                    OUT_OBJ["errors"].append("ChannelType_dir_failed: " + str(e))
+                    OUT_OBJ["attempts"].append({"step":"ts.get_stack()","ok":False,"err":str(e)})
 
-            def pick_channel(key):
-                k = (key or "").lower()
-                # Skip combined textures that should not map to a single channel
-                if "metallicsmoothness" in k or "metallicgloss" in k:
-                    return None
-                # prefer exact matches first
-                for cand in (k, k.replace(" ", ""), k.replace("_","")):
-                    if cand in lower_to_member:
-                        return getattr(CT, lower_to_member[cand])
-                # common aliases
-                if "base" in k or "albedo" in k or "diffuse" in k or "color" in k:
-                    for cand in ("basecolor","base_color","albedo","diffuse","color"):
-                        if cand in lower_to_member:
-                            return getattr(CT, lower_to_member[cand])
-                if "normal" in k:
-                    for cand in ("normal","normalmap","normal_map"):
-                        if cand in lower_to_member:
-                            return getattr(CT, lower_to_member[cand])
-                if "rough" in k:
-                    for cand in ("roughness","rough"):
-                        if cand in lower_to_member:
-                            return getattr(CT, lower_to_member[cand])
-                if "metal" in k:
-                    for cand in ("metallic","metalness","metal"):
-                        if cand in lower_to_member:
-                            return getattr(CT, lower_to_member[cand])
-                if "ao" in k or "occlusion" in k:
-                    for cand in ("ao","ambientocclusion","occlusion"):
-                        if cand in lower_to_member:
-                            return getattr(CT, lower_to_member[cand])
-                if "emis" in k or "emission" in k:
-                    for cand in ("emissive","emission","emis"):
-                        if cand in lower_to_member:
-                            return getattr(CT, lower_to_member[cand])
-                if "height" in k or "parallax" in k or "displacement" in k:
-                    for cand in ("height","displacement","parallax"):
-                        if cand in lower_to_member:
-                            return getattr(CT, lower_to_member[cand])
-                return None
+            if stack is None:
+                OUT_OBJ["errors"].append("No stack obtained from TextureSet")
+                return False
+            else:
+                OUT_OBJ["stack"] = {"type": str(type(stack)), "repr": str(stack)}
 
-            for k in KEY_TO_PATH.keys():
+                roots = []
                 try:
-                    ch = pick_channel(k)
-                    OUT_OBJ["channeltype_map"][k] = str(ch) if ch is not None else None
+                    roots = ls.get_root_layer_nodes(stack)
+                    OUT_OBJ["roots"] = [{"type": str(type(r)), "repr": str(r)} for r in roots]
                 except Exception as e:
-                    OUT_OBJ["channeltype_map"][k] = "ERR:" + str(e)
-
-            # --- ensure required channels exist on TextureSet ---
-            # add_channel() does NOT exist on TextureSet in SDK 0.3.4.
-            # We must discover the correct API: it might be on Stack, or a
-            # module-level function.
-            OUT_OBJ["channels_added"] = []
-            OUT_OBJ["existing_channels"] = []
-
-            # --- DISCOVERY: enumerate all public methods on key objects ---
-            # This helps us find the actual add_channel API location
-            OUT_OBJ["_diag_ts_dir"] = sorted([m for m in dir(ts) if not m.startswith("_")]) if ts is not None else []
-            OUT_OBJ["_diag_stack_dir"] = sorted([m for m in dir(stack) if not m.startswith("_")]) if stack is not None else []
-            OUT_OBJ["_diag_textureset_module_dir"] = sorted([m for m in dir(textureset) if not m.startswith("_")])
-
-            # Try to list existing channels via various APIs
-            if ts is not None:
-                for _ch_method in ("all_channels", "get_channels", "channels"):
-                    try:
-                        _fn = getattr(ts, _ch_method, None)
-                        if _fn is not None:
-                            _existing = _fn() if callable(_fn) else _fn
-                            OUT_OBJ["existing_channels"] = [str(c) for c in _existing]
-                            OUT_OBJ["existing_channels_via"] = "ts." + _ch_method
-                            break
-                    except Exception as _ec:
-                        OUT_OBJ["existing_channels_err_" + _ch_method] = str(_ec)
-            if stack is not None and not OUT_OBJ["existing_channels"]:
-                for _ch_method in ("all_channels", "get_channels", "channels"):
+                    OUT_OBJ["errors"].append("get_root_layer_nodes_failed: " + str(e))
+
+                # --- ChannelType discovery ---
+                CT = None
+                try:
+                    if hasattr(textureset, "ChannelType"):
+                        CT = textureset.ChannelType
+                    elif hasattr(textureset, "Channel"):
+                        CT = textureset.Channel
+                except Exception as e:
+                    OUT_OBJ["errors"].append("ChannelType_discovery_failed: " + str(e))
+
+                lower_to_member = {}
+                if CT is not None:
                     try:
-                        _fn = getattr(stack, _ch_method, None)
-                        if _fn is not None:
-                            _existing = _fn() if callable(_fn) else _fn
-                            OUT_OBJ["existing_channels"] = [str(c) for c in _existing]
-                            OUT_OBJ["existing_channels_via"] = "stack." + _ch_method
-                            break
-                    except Exception as _ec:
-                        OUT_OBJ["existing_channels_err_stack_" + _ch_method] = str(_ec)
-
-            # --- Try to add channels using every possible API location ---
-            if CT is not None:
-                def _pick_formats(channel):
-                    ch_name = str(channel).lower()
-                    CF = getattr(textureset, "ChannelFormat", None)
-                    fmts = []
-                    if CF is not None:
-                        if any(w in ch_name for w in ("ao", "occlusion", "metallic", "roughness", "height", "glossi")):
-                            for attr in ("L8", "L16", "L32F"):
-                                if hasattr(CF, attr):
-                                    fmts.append(("ChannelFormat." + attr, getattr(CF, attr)))
-                        if any(w in ch_name for w in ("emissive", "emission", "basecolor", "base_color", "diffuse", "normal")):
-                            for attr in ("sRGB8", "RGB8", "RGB16", "RGB32F"):
-                                if hasattr(CF, attr):
-                                    fmts.append(("ChannelFormat." + attr, getattr(CF, attr)))
-                        if not fmts:
-                            for attr in ("L8", "sRGB8", "RGB8"):
-                                if hasattr(CF, attr):
-                                    fmts.append(("ChannelFormat." + attr, getattr(CF, attr)))
-                    fmts.append(("no_format", None))
-                    return fmts
-
-                # Build list of (label, callable) for add_channel attempts
-                def _build_add_attempts(ch, fmt_val, fmt_label):
-                    attempts = []
-                    # 1. stack.add_channel(ch, fmt)
-                    if stack is not None and hasattr(stack, "add_channel"):
-                        if fmt_val is not None:
-                            attempts.append(("stack.add_channel(ch," + fmt_label + ")",
-                                             lambda _s=stack,_c=ch,_f=fmt_val: _s.add_channel(_c, _f)))
-                        attempts.append(("stack.add_channel(ch)",
-                                         lambda _s=stack,_c=ch: _s.add_channel(_c)))
-                    # 2. ts.add_channel(ch, fmt)
-                    if ts is not None and hasattr(ts, "add_channel"):
-                        if fmt_val is not None:
-                            attempts.append(("ts.add_channel(ch," + fmt_label + ")",
-                                             lambda _t=ts,_c=ch,_f=fmt_val: _t.add_channel(_c, _f)))
-                        attempts.append(("ts.add_channel(ch)",
-                                         lambda _t=ts,_c=ch: _t.add_channel(_c)))
-                    # 3. Module-level: textureset.add_channel(ts, ch, fmt), textureset.add_channel(stack, ch, fmt)
-                    if hasattr(textureset, "add_channel"):
-                        if fmt_val is not None:
-                            attempts.append(("textureset.add_channel(ts,ch," + fmt_label + ")",
-                                             lambda _c=ch,_f=fmt_val: textureset.add_channel(ts, _c, _f)))
-                            attempts.append(("textureset.add_channel(stack,ch," + fmt_label + ")",
-                                             lambda _c=ch,_f=fmt_val: textureset.add_channel(stack, _c, _f)))
-                        attempts.append(("textureset.add_channel(ts,ch)",
-                                         lambda _c=ch: textureset.add_channel(ts, _c)))
-                    # 4. Stack.edit_channel_list / set_channels
-                    if stack is not None:
-                        for mname in ("edit_channel_list", "set_channels"):
-                            if hasattr(stack, mname):
-                                attempts.append(("stack." + mname,
-                                                 lambda _s=stack,_m=mname,_c=ch: getattr(_s, _m)(_c)))
-                    return attempts
+                        _members = STORE.get("bootstrap", "channeltype_members")
+                        if _members is None:
+                            _members = [_nm for _nm in dir(CT) if not _nm.startswith("_")]
+                            STORE.put("bootstrap", "channeltype_members", _members)
+                        for _nm in _members:
+                            OUT_OBJ["channeltype_members"].append(_nm)
+                            lower_to_member[_nm.lower()] = _nm
+                    except Exception as e:
+                        OUT_OBJ["errors"].append("ChannelType_dir_failed: " + str(e))
+
+                def pick_channel(key):
+                    k = (key or "").lower()
+                    # Skip combined textures that should not map to a single channel
+                    if "metallicsmoothness" in k or "metallicgloss" in k:
+                        return None
+                    # prefer exact matches first
+                    for cand in (k, k.replace(" ", ""), k.replace("_","")):
+                        if cand in lower_to_member:
+                            return getattr(CT, lower_to_member[cand])
+                    # common aliases
+                    if "base" in k or "albedo" in k or "diffuse" in k or "color" in k:
+                        for cand in ("basecolor","base_color","albedo","diffuse","color"):
+                            if cand in lower_to_member:
+                                return getattr(CT, lower_to_member[cand])
+                    if "normal" in k:
+                        for cand in ("normal","normalmap","normal_map"):
+                            if cand in lower_to_member:
+                                return getattr(CT, lower_to_member[cand])
+                    if "rough" in k:
+                        for cand in ("roughness","rough"):
+                            if cand in lower_to_member:
+                                return getattr(CT, lower_to_member[cand])
+                    if "metal" in k:
+                        for cand in ("metallic","metalness","metal"):
+                            if cand in lower_to_member:
+                                return getattr(CT, lower_to_member[cand])
+                    if "ao" in k or "occlusion" in k:
+                        for cand in ("ao","ambientocclusion","occlusion"):
+                            if cand in lower_to_member:
+                                return getattr(CT, lower_to_member[cand])
+                    if "emis" in k or "emission" in k:
+                        for cand in ("emissive","emission","emis"):
+                            if cand in lower_to_member:
+                                return getattr(CT, lower_to_member[cand])
+                    if "height" in k or "parallax" in k or "displacement" in k:
+                        for cand in ("height","displacement","parallax"):
+                            if cand in lower_to_member:
+                                return getattr(CT, lower_to_member[cand])
+                    return None
 
                 for k in KEY_TO_PATH.keys():
-                    ch = pick_channel(k)
-                    if ch is None:
-                        continue
-                    added = False
-                    add_err = None
-                    all_tried = []
-                    for fmt_label, fmt_val in _pick_formats(ch):
-                        for try_label, try_fn in _build_add_attempts(ch, fmt_val, fmt_label):
-                            try:
-                                try_fn()
-                                added = True
-                                OUT_OBJ["channels_added"].append({"key": k, "channel": str(ch), "via": try_label, "ok": True})
+                    try:
+                        ch = pick_channel(k)
+                        OUT_OBJ["channeltype_map"][k] = str(ch) if ch is not None else None
+                    except Exception as e:
+                        OUT_OBJ["channeltype_map"][k] = "ERR:" + str(e)
+
+                # --- ensure required channels exist on TextureSet ---
+                # add_channel() does NOT exist on TextureSet in SDK 0.3.4.
+                # We must discover the correct API: it might be on Stack, or a
+                # module-level function.
+                _s = time.perf_counter()
+                OUT_OBJ["channels_added"] = []
+                OUT_OBJ["existing_channels"] = []
+
+                # --- DISCOVERY: enumerate all public methods on key objects ---
+                # This helps us find the actual add_channel API location
+                OUT_OBJ["_diag_ts_dir"] = sorted([m for m in dir(ts) if not m.startswith("_")]) if ts is not None else []
+                OUT_OBJ["_diag_stack_dir"] = sorted([m for m in dir(stack) if not m.startswith("_")]) if stack is not None else []
+                OUT_OBJ["_diag_textureset_module_dir"] = sorted([m for m in dir(textureset) if not m.startswith("_")])
+
+                # Try to list existing channels via various APIs
+                if ts is not None:
+                    for _ch_method in ("all_channels", "get_channels", "channels"):
+                        try:
+                            _fn = getattr(ts, _ch_method, None)
+                            if _fn is not None:
+                                _existing = _fn() if callable(_fn) else _fn
+                                OUT_OBJ["existing_channels"] = [str(c) for c in _existing]
+                                OUT_OBJ["existing_channels_via"] = "ts." + _ch_method
                                 break
-                            except Exception as e:
-                                es = str(e).lower()
-                                if any(w in es for w in ("already", "exist", "present", "duplicate")):
+                        except Exception as _ec:
+                            OUT_OBJ["existing_channels_err_" + _ch_method] = str(_ec)
+                if stack is not None and not OUT_OBJ["existing_channels"]:
+                    for _ch_method in ("all_channels", "get_channels", "channels"):
+                        try:
+                            _fn = getattr(stack, _ch_method, None)
+                            if _fn is not None:
+                                _existing = _fn() if callable(_fn) else _fn
+                                OUT_OBJ["existing_channels"] = [str(c) for c in _existing]
+                                OUT_OBJ["existing_channels_via"] = "stack." + _ch_method
+                                break
+                        except Exception as _ec:
+                            OUT_OBJ["existing_channels_err_stack_" + _ch_method] = str(_ec)
+
+                # --- Try to add channels using every possible API location ---
+                if CT is not None:
+                    def _pick_formats(channel):
+                        ch_name = str(channel).lower()
+                        CF = getattr(textureset, "ChannelFormat", None)
+                        fmts = []
+                        if CF is not None:
+                            if any(w in ch_name for w in ("ao", "occlusion", "metallic", "roughness", "height", "glossi")):
+                                for attr in ("L8", "L16", "L32F"):
+                                    if hasattr(CF, attr):
+                                        fmts.append(("ChannelFormat." + attr, getattr(CF, attr)))
+                            if any(w in ch_name for w in ("emissive", "emission", "basecolor", "base_color", "diffuse", "normal")):
+                                for attr in ("sRGB8", "RGB8", "RGB16", "RGB32F"):
+                                    if hasattr(CF, attr):
+                                        fmts.append(("ChannelFormat." + attr, getattr(CF, attr)))
+                            if not fmts:
+                                for attr in ("L8", "sRGB8", "RGB8"):
+                                    if hasattr(CF, attr):
+                                        fmts.append(("ChannelFormat." + attr, getattr(CF, attr)))
+                        fmts.append(("no_format", None))
+                        return fmts
+
+                    # Build list of (label, callable) for add_channel attempts
+                    def _build_add_attempts(ch, fmt_val, fmt_label):
+                        attempts = []
+                        # 1. stack.add_channel(ch, fmt)
+                        if stack is not None and hasattr(stack, "add_channel"):
+                            if fmt_val is not None:
+                                attempts.append(("stack.add_channel(ch," + fmt_label + ")",
+                                                 lambda _s=stack,_c=ch,_f=fmt_val: _s.add_channel(_c, _f)))
+                            attempts.append(("stack.add_channel(ch)",
+                                             lambda _s=stack,_c=ch: _s.add_channel(_c)))
+                        # 2. ts.add_channel(ch, fmt)
+                        if ts is not None and hasattr(ts, "add_channel"):
+                            if fmt_val is not None:
+                                attempts.append(("ts.add_channel(ch," + fmt_label + ")",
+                                                 lambda _t=ts,_c=ch,_f=fmt_val: _t.add_channel(_c, _f)))
+                            attempts.append(("ts.add_channel(ch)",
+                                             lambda _t=ts,_c=ch: _t.add_channel(_c)))
+                        # 3. Module-level: textureset.add_channel(ts, ch, fmt), textureset.add_channel(stack, ch, fmt)
+                        if hasattr(textureset, "add_channel"):
+                            if fmt_val is not None:
+                                attempts.append(("textureset.add_channel(ts,ch," + fmt_label + ")",
+                                                 lambda _c=ch,_f=fmt_val: textureset.add_channel(ts, _c, _f)))
+                                attempts.append(("textureset.add_channel(stack,ch," + fmt_label + ")",
+                                                 lambda _c=ch,_f=fmt_val: textureset.add_channel(stack, _c, _f)))
+                            attempts.append(("textureset.add_channel(ts,ch)",
+                                             lambda _c=ch: textureset.add_channel(ts, _c)))
+                        # 4. Stack.edit_channel_list / set_channels
+                        if stack is not None:
+                            for mname in ("edit_channel_list", "set_channels"):
+                                if hasattr(stack, mname):
+                                    attempts.append(("stack." + mname,
+                                                     lambda _s=stack,_m=mname,_c=ch: getattr(_s, _m)(_c)))
+                        return attempts
+
+                    for k in KEY_TO_PATH.keys():
+                        ch = pick_channel(k)
+                        if ch is None:
+                            continue
+                        added = False
+                        add_err = None
+                        all_tried = []
+                        for fmt_label, fmt_val in _pick_formats(ch):
+                            for try_label, try_fn in _build_add_attempts(ch, fmt_val, fmt_label):
+                                try:
+                                    try_fn()
                                     added = True
-                                    OUT_OBJ["channels_added"].append({"key": k, "channel": str(ch), "via": "already_exists(" + try_label + ")", "ok": True, "detail": str(e)})
+                                    OUT_OBJ["channels_added"].append({"key": k, "channel": str(ch), "via": try_label, "ok": True})
                                     break
-                                add_err = str(e)
-                                all_tried.append({"via": try_label, "err": str(e)})
-                                continue
-                        if added:
-                            break
+                                except Exception as e:
+                                    es = str(e).lower()
+                                    if any(w in es for w in ("already", "exist", "present", "duplicate")):
+                                        added = True
+                                        OUT_OBJ["channels_added"].append({"key": k, "channel": str(ch), "via": "already_exists(" + try_label + ")", "ok": True, "detail": str(e)})
+                                        break
+                                    add_err = str(e)
+                                    all_tried.append({"via": try_label, "err": str(e)})
+                                    continue
+                            if added:
+                                break
 
-                    if not added:
-                        OUT_OBJ["channels_added"].append({"key": k, "channel": str(ch), "via": "all_failed", "ok": False, "err": add_err or "unknown", "tried": all_tried})
-                        OUT_OBJ["attempts"].append({"step": "add_channel_" + k, "ok": False, "err": add_err or "unknown"})
+                        if not added:
+                            OUT_OBJ["channels_added"].append({"key": k, "channel": str(ch), "via": "all_failed", "ok": False, "err": add_err or "unknown", "tried": all_tried})
+                            OUT_OBJ["attempts"].append({"step": "add_channel_" + k, "ok": False, "err": add_err or "unknown"})
 
-            # --- create insert position + fill ---
-            pos = None
-            try:
-                if hasattr(ls, "InsertPosition") and hasattr(ls.InsertPosition, "from_textureset_stack"):
-                    pos = ls.InsertPosition.from_textureset_stack(stack)
-                    OUT_OBJ["attempts"].append({"step":"InsertPosition.from_textureset_stack","ok":True,"type":str(type(pos))})
-            except Exception as e:
-                OUT_OBJ["attempts"].append({"step":"InsertPosition.from_textureset_stack","ok":False,"err":str(e)})
+                _span("channels", _s)
 
-            if pos is None and roots:
-                for fn in ("above_node","below_node","inside_node"):
+                # --- reuse the fill created by an earlier run (tagged by layer name) ---
+                _s = time.perf_counter()
+                reused = None
+                tagged = []
+                for _r in roots:
                     try:
-                        if hasattr(ls, "InsertPosition") and hasattr(ls.InsertPosition, fn):
-                            pos = getattr(ls.InsertPosition, fn)(roots[0])
-                            OUT_OBJ["attempts"].append({"step":"InsertPosition."+fn,"ok":True,"type":str(type(pos))})
-                            break
+                        if _r.get_name() == FILL_TAG and hasattr(_r, "set_source"):
+                            tagged.append(_r)
+                    except Exception:
+                        pass
+                if tagged:
+                    reused = tagged[0]
+                OUT_OBJ["fill_reused"] = reused is not None
+                OUT_OBJ["stale_fills_removed"] = 0
+                for _stale in tagged[1:]:
+                    try:
+                        ls.delete_node(_stale)
+                        OUT_OBJ["stale_fills_removed"] += 1
                     except Exception as e:
-                        OUT_OBJ["attempts"].append({"step":"InsertPosition."+fn,"ok":False,"err":str(e)})
+                        OUT_OBJ["attempts"].append({"step":"ls.delete_node(stale_fill)","ok":False,"err":str(e)})
+                _meta = _fill_meta_load()
+                _prev = _meta.get(OUT_OBJ["textureset"]) if reused is not None else None
+                _uid = None
+                try:
+                    _uid = reused.uid() if reused is not None else None
+                except Exception:
+                    pass
+                CTX["prev_sources"] = dict((_prev or {}).get("sources") or {}) if (_prev or {}).get("uid") == _uid else {}
+                _span("fill_lookup", _s)
+
+                # --- create insert position + fill ---
+                _s = time.perf_counter()
+                pos = None
+                try:
+                    if hasattr(ls, "InsertPosition") and hasattr(ls.InsertPosition, "from_textureset_stack"):
+                        pos = ls.InsertPosition.from_textureset_stack(stack)
+                        OUT_OBJ["attempts"].append({"step":"InsertPosition.from_textureset_stack","ok":True,"type":str(type(pos))})
+                except Exception as e:
+                    OUT_OBJ["attempts"].append({"step":"InsertPosition.from_textureset_stack","ok":False,"err":str(e)})
 
-            OUT_OBJ["insert_position"] = str(pos) if pos is not None else None
+                if pos is None and roots:
+                    for fn in ("above_node","below_node","inside_node"):
+                        try:
+                            if hasattr(ls, "InsertPosition") and hasattr(ls.InsertPosition, fn):
+                                pos = getattr(ls.InsertPosition, fn)(roots[0])
+                                OUT_OBJ["attempts"].append({"step":"InsertPosition."+fn,"ok":True,"type":str(type(pos))})
+                                break
+                        except Exception as e:
+                            OUT_OBJ["attempts"].append({"step":"InsertPosition."+fn,"ok":False,"err":str(e)})
 
-            fill = None
-            try:
-                if hasattr(ls, "insert_fill"):
-                    fill = ls.insert_fill(pos) if pos is not None else ls.insert_fill()
-                    OUT_OBJ["attempts"].append({"step":"ls.insert_fill","ok":True,"type":str(type(fill))})
-            except Exception as e:
-                OUT_OBJ["attempts"].append({"step":"ls.insert_fill","ok":False,"err":str(e)})
+                OUT_OBJ["insert_position"] = str(pos) if pos is not None else None
 
-            if fill is None:
-                OUT_OBJ["errors"].append("Fill creation failed")
-                OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
-            else:
-                OUT_OBJ["fill"] = {"type": str(type(fill)), "repr": str(fill)}
+                fill = reused
+                try:
+                    if fill is None and hasattr(ls, "insert_fill"):
+                        fill = ls.insert_fill(pos) if pos is not None else ls.insert_fill()
+                        OUT_OBJ["attempts"].append({"step":"ls.insert_fill","ok":True,"type":str(type(fill))})
+                        try:
+                            fill.set_name(FILL_TAG)
+                        except Exception as e:
+                            OUT_OBJ["attempts"].append({"step":"fill.set_name","ok":False,"err":str(e)})
+                except Exception as e:
+                    OUT_OBJ["attempts"].append({"step":"ls.insert_fill","ok":False,"err":str(e)})
+                if reused is None:
+                    _span("insert_fill", _s)
+
+                if fill is None:
+                    OUT_OBJ["errors"].append("Fill creation failed")
+                    return False
+                else:
+                    OUT_OBJ["fill"] = {"type": str(type(fill)), "repr": str(fill)}
+
+                    # --- import textures and bind to fill ---
+                    def _pick_resource_usage(res_mod):
+                        usage = None
+                        try:
+                            RU = getattr(res_mod, "ResourceUsage", None) or getattr(res_mod, "Usage", None)
+                            if RU is None:
+                                return None
+                            names = [n for n in dir(RU) if not n.startswith("_")]
+                            prefer = []
+                            for n in names:
+                                ln = n.lower()
+                                if "texture" in ln or "bitmap" in ln or "image" in ln:
+                                    prefer.append(n)
+                            pick = prefer[0] if prefer else (names[0] if names else None)
+                            return getattr(RU, pick) if pick else None
+                        except Exception:
+                            return None
 
-                # --- import textures and bind to fill ---
-                def _pick_resource_usage(res_mod):
-                    usage = None
-                    try:
-                        RU = getattr(res_mod, "ResourceUsage", None) or getattr(res_mod, "Usage", None)
-                        if RU is None:
+                    def _project_lineage():
+                        # survives save_as (variants), so resources imported before a save_as are still reused
+                        try:
+                            import substance_painter.project as project
+                            import uuid
+                            md = project.Metadata("UnityBridge")
+                            lineage = md.get("lineage")
+                            if not lineage:
+                                lineage = uuid.uuid4().hex
+                                md.set("lineage", lineage)
+                            return lineage
+                        except Exception:
                             return None
-                        names = [n for n in dir(RU) if not n.startswith("_")]
-                        prefer = []
-                        for n in names:
-                            ln = n.lower()
-                            if "texture" in ln or "bitmap" in ln or "image" in ln:
-                                prefer.append(n)
-                        pick = prefer[0] if prefer else (names[0] if names else None)
-                        return getattr(RU, pick) if pick else None
-                    except Exception:
-                        return None
 
-                def import_texture(path):
-                    try:
-                        import substance_painter.resource as res
-                    except Exception as e:
-                        return (False, None, "resource_module_failed:" + str(e))
+                    def _resource_cache_key(path):
+                        try:
+                            import substance_painter.project as project
+                            _proj = _project_lineage() or project.file_path() or project.name()
+                            _st = os.stat(path)
+                            return "|".join([str(_proj), os.path.normcase(os.path.abspath(path)), str(_st.st_mtime_ns), str(_st.st_size)])
+                        except Exception:
+                            return None
 
-                    if hasattr(res, "import_project_resource"):
+                    def _cached_resource(key):
+                        if not key:
+                            return None
+                        _rid = STORE.get("resource", key)
+                        if _rid is None:
+                            return None
                         try:
-                            usage = _pick_resource_usage(res)
-                            if usage is not None:
-                                try:
-                                    rid = res.import_project_resource(path, usage)
-                                    return (True, rid, "import_project_resource(path, usage)")
-                                except TypeError:
-                                    rid = res.import_project_resource(path, resource_usage=usage)
-                                    return (True, rid, "import_project_resource(path, resource_usage=usage)")
-                            rid = res.import_project_resource(path)
-                            return (True, rid, "import_project_resource(path)")
+                            import substance_painter.resource as resmod
+                            if resmod.Resource.retrieve(_rid):
+                                return _rid
+                        except Exception:
+                            pass
+                        STORE.pop("resource", key)
+                        return None
+
+                    def import_texture(path):
+                        try:
+                            import substance_painter.resource as res
                         except Exception as e:
-                            OUT_OBJ["attempts"].append({"step":"resource.import_project_resource","ok":False,"path":path,"err":str(e)})
+                            return (False, None, "resource_module_failed:" + str(e))
 
-                    for fn in ("import_project","import_","import"):
-                        if hasattr(res, fn):
+                        if hasattr(res, "import_project_resource"):
                             try:
-                                rid = getattr(res, fn)(path)
-                                return (True, rid, fn)
+                                usage = _pick_resource_usage(res)
+                                if usage is not None:
+                                    try:
+                                        rid = res.import_project_resource(path, usage)
+                                        return (True, rid, "import_project_resource(path, usage)")
+                                    except TypeError:
+                                        rid = res.import_project_resource(path, resource_usage=usage)
+                                        return (True, rid, "import_project_resource(path, resource_usage=usage)")
+                                rid = res.import_project_resource(path)
+                                return (True, rid, "import_project_resource(path)")
                             except Exception as e:
-                                OUT_OBJ["attempts"].append({"step":"resource."+fn,"ok":False,"path":path,"err":str(e)})
+                                OUT_OBJ["attempts"].append({"step":"resource.import_project_resource","ok":False,"path":path,"err":str(e)})
 
-                    return (False, None, "no_import_fn_worked")
+                        for fn in ("import_project","import_","import"):
+                            if hasattr(res, fn):
+                                try:
+                                    rid = getattr(res, fn)(path)
+                                    return (True, rid, fn)
+                                except Exception as e:
+                                    OUT_OBJ["attempts"].append({"step":"resource."+fn,"ok":False,"path":path,"err":str(e)})
 
-                for key, path in KEY_TO_PATH.items():
-                    item = {"key": key, "path": path, "import_ok": False, "import_via": None, "resource": None, "set_ok": False, "set_err": None}
-                    try:
-                        if not os.path.exists(path):
-                            item["set_err"] = "missing_file"
-                            OUT_OBJ["imports"].append(item)
-                            continue
-                        ok, rid, via = import_texture(path)
-                        item["import_ok"] = bool(ok)
-                        item["import_via"] = via
-                        item["resource"] = str(rid) if rid is not None else None
-
-                        # Convert returned Resource -> ResourceID if needed
-                        rid_id = rid
-                        item["resource_type"] = str(type(rid)) if rid is not None else None
-                        item["resource_id_type"] = None
-                        item["resource_id"] = None
+                        return (False, None, "no_import_fn_worked")
+
+                    def import_shared(path, entry):
+                        """Resolve a shared texture by its library index URL; import it into the library shelf once."""
                         try:
-                            import substance_painter.resource as resmod
+                            import substance_painter.resource as res
+                        except Exception as e:
+                            return (False, None, "resource_module_failed:" + str(e))
+                        shelf = None
+                        try:
+                            if not res.Shelves.exists(entry["shelf"]):
+                                res.Shelves.add(entry["shelf"], entry["folder"])
+                            shelf = res.Shelf(entry["shelf"])
+                        except Exception as e:
+                            OUT_OBJ["attempts"].append({"step":"resource.Shelves.add","ok":False,"err":str(e)})
+                        if entry.get("url"):
+                            try:
+                                rid = res.ResourceID.from_url(entry["url"])
+                                if res.Resource.retrieve(rid):
+                                    return (True, rid, "shared_index")
+                            except Exception as e:
+                                OUT_OBJ["attempts"].append({"step":"shared_index.retrieve","ok":False,"url":entry["url"],"err":str(e)})
+                        usage = _pick_resource_usage(res)
+                        if shelf is not None:
+                            try:
+                                if shelf.can_import_resources():
+                                    return (True, shelf.import_resource(path, usage), "shelf.import_resource")
+                            except Exception as e:
+                                OUT_OBJ["attempts"].append({"step":"shelf.import_resource","ok":False,"path":path,"err":str(e)})
+                        if hasattr(res, "import_session_resource"):
+                            try:
+                                return (True, res.import_session_resource(path, usage), "import_session_resource")
+                            except Exception as e:
+                                OUT_OBJ["attempts"].append({"step":"resource.import_session_resource","ok":False,"path":path,"err":str(e)})
+                        return import_texture(path)
 
-                            # 1) Already a ResourceID?
-                            if hasattr(resmod, "ResourceID") and rid is not None and isinstance(rid, resmod.ResourceID):
-                                rid_id = rid
-                                item["resource_id_type"] = str(type(rid_id))
-                                item["resource_id"] = str(rid_id)
+                    CTX.update(fill=fill, CT=CT, pick_channel=pick_channel, import_texture=import_texture, import_shared=import_shared,
+                               resource_cache_key=_resource_cache_key, cached_resource=_cached_resource,
+                               fill_reused=reused is not None, new_sources={}, replaced=[])
+                    return True
+    return False
 
-                            # 2) Try common attributes on Resource-like objects
-                            if rid is not None and item["resource_id"] is None:
-                                for _attr in ("identifier", "resource_id", "id", "resourceId"):
-                                    try:
-                                        if not hasattr(rid, _attr):
-                                            continue
-                                        _v = getattr(rid, _attr)
-                                        _v = _v() if callable(_v) else _v
-                                        if _v is None:
-                                            continue
-                                        if hasattr(resmod, "ResourceID") and isinstance(_v, resmod.ResourceID):
-                                            rid_id = _v
-                                            item["resource_id_type"] = str(type(rid_id))
-                                            item["resource_id"] = str(rid_id)
-                                            break
-                                        item["resource_id_candidate"] = str(_v)
-                                    except Exception as e:
-                                        OUT_OBJ["attempts"].append({"step":"rid.attr."+_attr,"ok":False,"err":str(e)})
-
-                            # 3) Try ResourceID constructors / factories
-                            if hasattr(resmod, "ResourceID") and rid is not None and item["resource_id"] is None:
-                                _cands = []
-                                _cands.append(("ResourceID(resource)", lambda: resmod.ResourceID(rid)))
-                                if hasattr(rid, "handle"):
-                                    _cands.append(("ResourceID(handle)", lambda: resmod.ResourceID(rid.handle)))
-                                for _fn in ("from_resource", "fromResource", "from_handle", "fromHandle"):
-                                    if hasattr(resmod.ResourceID, _fn):
-                                        _cands.append(("ResourceID."+_fn+"(resource)", lambda _fn=_fn: getattr(resmod.ResourceID, _fn)(rid)))
-                                        if hasattr(rid, "handle"):
-                                            _cands.append(("ResourceID."+_fn+"(handle)", lambda _fn=_fn: getattr(resmod.ResourceID, _fn)(rid.handle)))
-                                for _label, _call in _cands:
-                                    try:
-                                        _v = _call()
-                                        if _v is None:
-                                            continue
-                                        if isinstance(_v, resmod.ResourceID):
-                                            rid_id = _v
-                                            item["resource_id_type"] = str(type(rid_id))
-                                            item["resource_id"] = str(rid_id)
-                                            break
-                                    except Exception as e:
-                                        OUT_OBJ["attempts"].append({"step":"rid.to_resourceid."+_label,"ok":False,"err":str(e)})
+# --- one texture: import (or reuse) the resource and bind it to the fill ---
+def _apply_one(key, path):
+    fill = CTX["fill"]
+    CT = CTX["CT"]
+    pick_channel = CTX["pick_channel"]
+    import_texture = CTX["import_texture"]
+    _resource_cache_key = CTX["resource_cache_key"]
+    _cached_resource = CTX["cached_resource"]
+    item = {"key": key, "path": path, "import_ok": False, "import_via": None, "resource": None, "set_ok": False, "set_err": None}
+    try:
+        if not os.path.exists(path):
+            item["set_err"] = "missing_file"
+            OUT_OBJ["imports"].append(item)
+            return item
+        # Source unchanged since the tagged fill was last updated: leave the channel alone
+        _sig = _file_sig(path)
+        _prev = CTX["prev_sources"].get(key)
+        _ch0 = pick_channel(key) if CT is not None else None
+        if CTX["fill_reused"] and _prev and _prev.get("sig") == _sig and _ch0 is not None:
+            _t0 = time.perf_counter()
+            try:
+                _have = fill.get_source(_ch0) is not None
+            except Exception:
+                _have = False
+            _span("unchanged_check", _t0, key)
+            if _have:
+                item.update({"import_ok": True, "import_via": "unchanged", "set_ok": True, "unchanged": True,
+                             "resource": _prev.get("resource")})
+                CTX["new_sources"][key] = _prev
+                OUT_OBJ["imports"].append(item)
+                return item
+        # Reuse a ResourceID imported earlier in this session for the same file/project
+        _shared = SHARED.get(path)
+        _ck = _resource_cache_key(path) if _shared is None else None
+        _cached = _cached_resource(_ck)
+        if _shared is not None:
+            item["shared_hash"] = _shared.get("hash")
+            _t0 = time.perf_counter()
+            ok, rid, via = CTX["import_shared"](path, _shared)
+            item["import_sec"] = round(time.perf_counter() - _t0, 4)
+            _span("import_texture", _t0, key)
+        elif _cached is not None:
+            ok, rid, via = True, _cached, "state_store_cache"
+        else:
+            _t0 = time.perf_counter()
+            ok, rid, via = import_texture(path)
+            item["import_sec"] = round(time.perf_counter() - _t0, 4)
+            _span("import_texture", _t0, key)
+        item["import_ok"] = bool(ok)
+        item["import_via"] = via
+        item["resource"] = str(rid) if rid is not None else None
+
+        # Convert returned Resource -> ResourceID if needed
+        _t0 = time.perf_counter()
+        rid_id = rid
+        item["resource_type"] = str(type(rid)) if rid is not None else None
+        item["resource_id_type"] = None
+        item["resource_id"] = None
+        try:
+            import substance_painter.resource as resmod
 
-                        except Exception as e:
-                            OUT_OBJ["attempts"].append({"step":"rid.to_resourceid","ok":False,"err":str(e)})
+            # 1) Already a ResourceID?
+            if hasattr(resmod, "ResourceID") and rid is not None and isinstance(rid, resmod.ResourceID):
+                rid_id = rid
+                item["resource_id_type"] = str(type(rid_id))
+                item["resource_id"] = str(rid_id)
 
-                        if not ok:
-                            item["set_err"] = "import_failed"
-                            OUT_OBJ["imports"].append(item)
+            # 2) Try common attributes on Resource-like objects
+            if rid is not None and item["resource_id"] is None:
+                for _attr in ("identifier", "resource_id", "id", "resourceId"):
+                    try:
+                        if not hasattr(rid, _attr):
                             continue
-
-                        ch = pick_channel(key) if CT is not None else None
-                        if ch is None:
-                            item["set_err"] = "channeltype_not_found_for_key"
-                            OUT_OBJ["imports"].append(item)
+                        _v = getattr(rid, _attr)
+                        _v = _v() if callable(_v) else _v
+                        if _v is None:
+                            continue
+                        if hasattr(resmod, "ResourceID") and isinstance(_v, resmod.ResourceID):
+                            rid_id = _v
+                            item["resource_id_type"] = str(type(rid_id))
+                            item["resource_id"] = str(rid_id)
+                            break
+                        item["resource_id_candidate"] = str(_v)
+                    except Exception as e:
+                        OUT_OBJ["attempts"].append({"step":"rid.attr."+_attr,"ok":False,"err":str(e)})
+
+            # 3) Try ResourceID constructors / factories
+            if hasattr(resmod, "ResourceID") and rid is not None and item["resource_id"] is None:
+                _cands = []
+                _cands.append(("ResourceID(resource)", lambda: resmod.ResourceID(rid)))
+                if hasattr(rid, "handle"):
+                    _cands.append(("ResourceID(handle)", lambda: resmod.ResourceID(rid.handle)))
+                for _fn in ("from_resource", "fromResource", "from_handle", "fromHandle"):
+                    if hasattr(resmod.ResourceID, _fn):
+                        _cands.append(("ResourceID."+_fn+"(resource)", lambda _fn=_fn: getattr(resmod.ResourceID, _fn)(rid)))
+                        if hasattr(rid, "handle"):
+                            _cands.append(("ResourceID."+_fn+"(handle)", lambda _fn=_fn: getattr(resmod.ResourceID, _fn)(rid.handle)))
+                for _label, _call in _cands:
+                    try:
+                        _v = _call()
+                        if _v is None:
                             continue
+                        if isinstance(_v, resmod.ResourceID):
+                            rid_id = _v
+                            item["resource_id_type"] = str(type(rid_id))
+                            item["resource_id"] = str(rid_id)
+                            break
+                    except Exception as e:
+                        OUT_OBJ["attempts"].append({"step":"rid.to_resourceid."+_label,"ok":False,"err":str(e)})
 
-                        # bind to fill layer (ChannelType, ResourceID)
-                        try:
-                            if hasattr(fill, "set_source"):
-                                fill.set_source(ch, rid_id)
-                                item["set_ok"] = True
-                            else:
-                                item["set_err"] = "fill_has_no_set_source"
-                        except Exception as e:
-                            item["set_err"] = str(e)
+        except Exception as e:
+            OUT_OBJ["attempts"].append({"step":"rid.to_resourceid","ok":False,"err":str(e)})
+        item["rid_sec"] = round(time.perf_counter() - _t0, 4)
+        _span("resource_id", _t0, key)
 
-                        OUT_OBJ["imports"].append(item)
-                    except Exception as e:
-                        item["set_err"] = "EX:" + str(e)
-                        OUT_OBJ["imports"].append(item)
+        if not ok:
+            item["set_err"] = "import_failed"
+            OUT_OBJ["imports"].append(item)
+            return item
 
-                OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
-'''
+        if _ck and _cached is None and item["resource_id"] is not None:
+            STORE.put("resource", _ck, rid_id)
 
-def _build_ensure_project_async_start(mesh_path: str, spp_path: str, save_delay: float, reopen_delay: float) -> str:
-    b = REMOTE_ENSURE_PROJECT_ASYNC_START
-    b = b.replace('__VERSION__', VERSION)
-    b = b.replace('__MESH__', (mesh_path or '').replace('\\', '\\\\').replace('"','\\"'))
-    b = b.replace('__SPP__', (spp_path or '').replace('\\', '\\\\').replace('"','\\"'))
-    b = b.replace('__SAVE_DELAY__', str(float(save_delay)))
+        ch = pick_channel(key) if CT is not None else None
+        if ch is None:
+            item["set_err"] = "channeltype_not_found_for_key"
+            OUT_OBJ["imports"].append(item)
+            return item
+
+        # bind to fill layer (ChannelType, ResourceID)
+        try:
+            if hasattr(fill, "set_source"):
+                _t0 = time.perf_counter()
+                fill.set_source(ch, rid_id)
+                item["bind_sec"] = round(time.perf_counter() - _t0, 4)
+                _span("set_source", _t0, key)
+                item["set_ok"] = True
+                _url = None
+                try:
+                    _url = rid_id.url()
+                except Exception:
+                    _url = item["resource_id"] or item["resource"]
+                CTX["new_sources"][key] = {"sig": _sig, "resource": _url, "channel": str(ch), "shared": _shared is not None}
+                if _shared is not None:
+                    item["shared_url"] = _url
+                # library resources are referenced by other projects: never clean them up from here
+                if _prev and _prev.get("resource") and _prev.get("resource") != _url and not _prev.get("shared"):
+                    CTX["replaced"].append(_prev.get("resource"))
+            else:
+                item["set_err"] = "fill_has_no_set_source"
+        except Exception as e:
+            item["set_err"] = str(e)
+
+        OUT_OBJ["imports"].append(item)
+    except Exception as e:
+        item["set_err"] = "EX:" + str(e)
+        OUT_OBJ["imports"].append(item)
+
+    return item
+
+# --- background job: setup, then one step per texture ---
+# Steps are chained with QTimer.singleShot so Painter API calls stay on the
+# main thread while remote polls are served between steps. Without Qt the
+# steps run on a worker thread like _worker_create_only.
+job_id = "apply-" + str(int(time.time() * 1000))
+state = {
+    "job_id": job_id,
+    "kind": "apply",
+    "status": "running",
+    "step": "setup",
+    "ts": time.time(),
+    "started": time.time(),
+    "textureset": OUT_OBJ["textureset"],
+    "total": len(KEY_TO_PATH),
+    "done": 0,
+    "progress": [],
+    "result": None,
+    "error": None,
+    "trace": None,
+    "cancel": False,
+}
+STORE.put("job", job_id, state)
+STEPS = list(KEY_TO_PATH.items())
+
+def _finish(status):
+    try:
+        _finalize_fill(status)
+    except Exception as e:
+        OUT_OBJ["errors"].append("finalize_fill_failed: " + str(e))
+    OUT_OBJ["_elapsed_sec"] = round(time.time() - state["started"], 3)
+    state["result"] = OUT_OBJ
+    state["status"] = status
+    state["step"] = status
+    state["ts"] = time.time()
+
+def _advance(i):
+    """Run step i (0 = setup, n = texture n-1); return the next index or None when finished."""
+    if state["cancel"]:
+        _finish("cancelled")
+        return None
+    try:
+        if i == 0:
+            state["step"] = "setup"; state["ts"] = time.time()
+            if not _setup():
+                state["error"] = (OUT_OBJ["errors"] or ["setup_failed"])[-1]
+                _finish("error")
+                return None
+        else:
+            key, path = STEPS[i - 1]
+            state["step"] = "texture:" + key; state["ts"] = time.time()
+            _t0 = time.perf_counter()
+            item = _apply_one(key, path)
+            item["total_sec"] = round(time.perf_counter() - _t0, 4)
+            status = "unchanged" if item.get("unchanged") else "bound" if item.get("set_ok") else ("imported" if item.get("import_ok") else "failed")
+            state["progress"].append({"key": key, "status": status, "import_sec": item.get("import_sec"),
+                                      "rid_sec": item.get("rid_sec"), "bind_sec": item.get("bind_sec"), "total_sec": item["total_sec"],
+                                      "err": item.get("set_err")})
+            state["done"] += 1
+    except Exception as e:
+        state["error"] = repr(e)
+        state["trace"] = traceback.format_exc()
+        if i == 0:
+            _finish("error")
+            return None
+    if i < len(STEPS):
+        return i + 1
+    _finish("done")
+    return None
+
+QtCore = None
+for _qt in ("PySide6", "PySide2"):
+    try:
+        QtCore = __import__(_qt + ".QtCore", fromlist=["QtCore"])
+        break
+    except Exception:
+        pass
+
+if QtCore is not None:
+    state["driver"] = "qt_timer"
+    def _tick(i):
+        n = _advance(i)
+        if n is not None:
+            QtCore.QTimer.singleShot(0, lambda: _tick(n))
+    QtCore.QTimer.singleShot(0, lambda: _tick(0))
+else:
+    state["driver"] = "thread"
+    def _loop():
+        i = 0
+        while i is not None:
+            i = _advance(i)
+    threading.Thread(target=_loop, daemon=True).start()
+
+OUT = json.dumps({"job_id": job_id, "textureset": OUT_OBJ["textureset"], "total": state["total"],
+                  "driver": state["driver"]}, ensure_ascii=False)
+'''
+
+# Shared by the fingerprint and export blocks: resolves the export preset URL and
+# builds a deterministic description of each TextureSet's layer stack.
+REMOTE_EXPORT_COMMON = r'''import json, os, time, traceback, hashlib
+
+PRESET_EXACT = "__PRESET_EXACT__"
+PRESET_HINT = "__PRESET_HINT__"
+AUTO_DETECT = __AUTO_DETECT__
+
+def _preset_candidates(export):
+    cands = []
+    try:
+        for p in export.list_resource_export_presets():
+            try:
+                nm = p.resource_id.name
+                cands.append((str(nm), p.resource_id.url()))
+            except Exception:
+                pass
+    except Exception as e:
+        OUT_OBJ["attempts"].append({"step":"list_resource_export_presets","ok":False,"err":str(e)})
+    try:
+        for p in export.list_predefined_export_presets():
+            try:
+                cands.append((str(p.name), p.url))
+            except Exception:
+                pass
+    except Exception as e:
+        OUT_OBJ["attempts"].append({"step":"list_predefined_export_presets","ok":False,"err":str(e)})
+    return cands
+
+def _resolve_preset(export):
+    cands = _preset_candidates(export)
+    OUT_OBJ["preset_candidates"] = [c[0] for c in cands]
+    if PRESET_EXACT:
+        for nm, url in cands:
+            if nm == PRESET_EXACT:
+                return nm, url, "exact"
+    if PRESET_EXACT and not AUTO_DETECT:
+        # the named preset was required and auto-detect is off: never fall back to some other preset
+        return None, None, "not_found"
+    hint = (PRESET_HINT or "Unity").lower()
+    best = None
+    for nm, url in cands:
+        ln = nm.lower()
+        if hint and hint not in ln:
+            continue
+        score = 0
+        # Unity Standard (Metallic) layout is what the Unity side expects back
+        if "standard" in ln: score += 2
+        if "metallic" in ln: score += 2
+        if "packed" in ln: score += 1
+        if "hd" in ln or "universal" in ln or "urp" in ln: score -= 3
+        if best is None or score > best[0]:
+            best = (score, nm, url)
+    if best is not None:
+        return best[1], best[2], "hint"
+    return None, None, "not_found"
+
+def _src_sig(src):
+    """Source identity plus its values: resource URL, uniform colour, substance/filter parameters."""
+    if src is None:
+        return None
+    sig = {"type": type(src).__name__}
+    try:
+        rid = getattr(src, "resource_id", None)
+        if rid is not None:
+            sig["resource"] = rid.url()
+    except Exception:
+        pass
+    try:
+        if hasattr(src, "get_color"):
+            c = src.get_color()
+            sig["color"] = [getattr(c, a, None) for a in ("r", "g", "b", "a")] if hasattr(c, "r") else str(c)
+    except Exception:
+        pass
+    try:
+        if hasattr(src, "get_parameters"):
+            sig["parameters"] = dict((str(k), str(v)) for k, v in sorted(src.get_parameters().items(), key=lambda kv: str(kv[0])))
+    except Exception:
+        pass
+    return sig
+
+def _node_sig(node, depth=0):
+    sig = {}
+    for attr in ("uid", "get_name", "get_type", "is_visible"):
+        try:
+            fn = getattr(node, attr, None)
+            if fn is not None:
+                sig[attr] = str(fn())
+        except Exception:
+            pass
+    # per channel: blend mode, opacity and (fill layers / fill effects) the source with its values
+    try:
+        chans = getattr(node, "active_channels", None)
+        if chans is not None:
+            per = {}
+            for ch in sorted(chans, key=str):
+                cs = {}
+                for key, getter in (("blend", "get_blending_mode"), ("opacity", "get_opacity"), ("source", "get_source")):
+                    fn = getattr(node, getter, None)
+                    if fn is None:
+                        continue
+                    try:
+                        v = fn(ch)
+                        cs[key] = _src_sig(v) if key == "source" else str(v)
+                    except Exception as e:
+                        cs[key] = "ERR:" + type(e).__name__
+                per[str(ch)] = cs
+            sig["channels"] = per
+        elif hasattr(node, "get_source"):
+            # filter / generator effects carry a single source without a channel
+            sig["source"] = _src_sig(node.get_source())
+    except Exception:
+        pass
+    if depth < 16:
+        for attr in ("sub_layers", "content_effects", "mask_effects"):
+            try:
+                fn = getattr(node, attr, None)
+                if fn is not None:
+                    sig[attr] = [_node_sig(c, depth + 1) for c in fn()]
+            except Exception:
+                pass
+    return sig
+
+def _textureset_fingerprint(ts, ls):
+    desc = {"name": ts.name()}
+    try:
+        r = ts.get_resolution()
+        desc["resolution"] = [r.width, r.height]
+    except Exception:
+        pass
+    stacks = []
+    try:
+        for stack in ts.all_stacks():
+            sd = {"stack": str(getattr(stack, "name", lambda: "")())}
+            try:
+                sd["channels"] = sorted(str(c) for c in stack.all_channels().keys())
+            except Exception:
+                pass
+            try:
+                sd["layers"] = [_node_sig(n) for n in ls.get_root_layer_nodes(stack)]
+            except Exception as e:
+                sd["layers_err"] = str(e)
+            stacks.append(sd)
+    except Exception as e:
+        desc["stacks_err"] = str(e)
+    desc["stacks"] = stacks
+    blob = json.dumps(desc, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+'''
+
+REMOTE_EXPORT_FINGERPRINT_TEMPLATE = REMOTE_EXPORT_COMMON + r'''
+OUT_OBJ = {
+    "_version": "__VERSION__",
+    "_ts": int(time.time()),
+    "preset": None,
+    "preset_url": None,
+    "preset_via": None,
+    "fingerprints": {},
+    "attempts": [],
+    "errors": []
+}
+
+try:
+    import substance_painter.export as export
+    import substance_painter.textureset as textureset
+    import substance_painter.layerstack as ls
+except Exception as e:
+    OUT_OBJ["errors"].append("import_modules_failed: " + str(e))
+else:
+    try:
+        OUT_OBJ["preset"], OUT_OBJ["preset_url"], OUT_OBJ["preset_via"] = _resolve_preset(export)
+    except Exception as e:
+        OUT_OBJ["errors"].append("resolve_preset_failed: " + str(e))
+    try:
+        for t in textureset.all_texture_sets():
+            try:
+                OUT_OBJ["fingerprints"][t.name()] = _textureset_fingerprint(t, ls)
+            except Exception as e:
+                OUT_OBJ["errors"].append("fingerprint_failed:" + str(e))
+    except Exception as e:
+        OUT_OBJ["errors"].append("all_texture_sets_failed: " + str(e))
+
+OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+'''
+
+REMOTE_EXPORT_TEMPLATE = r'''import json, os, time, traceback
+
+OUT_OBJ = {
+    "_version": "__VERSION__",
+    "_ts": int(time.time()),
+    "status": None,
+    "message": None,
+    "textures": {},
+    "attempts": [],
+    "errors": []
+}
+
+CONFIG = __EXPORT_CONFIG_JSON__
+
+try:
+    import substance_painter.export as export
+except Exception as e:
+    OUT_OBJ["errors"].append("import_modules_failed: " + str(e))
+else:
+    try:
+        d = CONFIG.get("exportPath")
+        if d and not os.path.exists(d):
+            os.makedirs(d, exist_ok=True)
+        res = export.export_project_textures(CONFIG)
+        OUT_OBJ["status"] = str(getattr(res, "status", None))
+        OUT_OBJ["message"] = str(getattr(res, "message", ""))
+        for k, paths in (getattr(res, "textures", None) or {}).items():
+            ts_name = k[0] if isinstance(k, tuple) else str(k)
+            OUT_OBJ["textures"].setdefault(ts_name, []).extend(str(p) for p in paths)
+    except Exception as e:
+        OUT_OBJ["errors"].append("export_project_textures_failed: " + str(e))
+        try:
+            OUT_OBJ["trace"] = traceback.format_exc()
+        except Exception:
+            pass
+
+OUT = json.dumps(OUT_OBJ, ensure_ascii=False)
+'''
+
+def _state_store_prelude(ttl=None, max_entries=None) -> str:
+    """Store setup code; ttl/max_entries reconfigure an existing store, None keeps its policy."""
+    b = REMOTE_STATE_STORE
+    b = b.replace('__STORE_TTL__', str(float(STATE_STORE_TTL_SEC if ttl is None else ttl)))
+    b = b.replace('__STORE_MAX__', str(int(STATE_STORE_MAX_ENTRIES if max_entries is None else max_entries)))
+    b = b.replace('__STORE_CONFIGURE__', 'False' if ttl is None and max_entries is None else 'True')
+    return b
+
+@_profiled_build
+def _build_fill_cleanup(keep_names) -> str:
+    b = _state_store_prelude() + REMOTE_FILL_CLEANUP.replace('__FILL_META_COMMON__', REMOTE_FILL_META_COMMON)
+    b = b.replace('__KEEP_JSON__', 'json.loads(%r)' % json.dumps(list(keep_names), ensure_ascii=False))
+    return b.replace('__FILL_TAG_PREFIX__', FILL_TAG_PREFIX)
+
+@_profiled_build
+def _build_job_poll(job_id: str) -> str:
+    return _build_ensure_project_async_poll(job_id)
+
+@_profiled_build
+def _build_job_cancel(job_id: str) -> str:
+    b = _state_store_prelude() + REMOTE_JOB_CANCEL
+    return b.replace('__JOB_ID__', (job_id or '').replace('\\', '\\\\').replace('"','\\"'))
+
+@_profiled_build
+def _build_state_release(job_id: str) -> str:
+    b = _state_store_prelude() + REMOTE_STATE_RELEASE
+    return b.replace('__JOB_ID__', (job_id or '').replace('\\', '\\\\').replace('"','\\"'))
+
+@_profiled_build
+def _build_state_status() -> str:
+    return _state_store_prelude() + REMOTE_STATE_STATUS
+
+@_profiled_build
+def _build_project_state() -> str:
+    return _state_store_prelude() + REMOTE_PROJECT_STATE
+
+@_profiled_build
+def _build_open_project(spp_path: str) -> str:
+    return REMOTE_OPEN_PROJECT.replace('__SPP__', spp_path or '')
+
+@_profiled_build
+def _build_save_as(spp_path: str) -> str:
+    return REMOTE_SAVE_AS.replace('__SPP__', spp_path or '')
+
+@_profiled_build
+def _build_ensure_project_async_start(mesh_path: str, spp_path: str, save_delay: float, reopen_delay: float,
+                                      store_ttl=None, store_max=None, settings=None) -> str:
+    b = _state_store_prelude(store_ttl, store_max) + REMOTE_ENSURE_PROJECT_ASYNC_START
+    b = b.replace('__VERSION__', VERSION)
+    b = b.replace('__MESH__', (mesh_path or '').replace('\\', '\\\\').replace('"','\\"'))
+    b = b.replace('__SPP__', (spp_path or '').replace('\\', '\\\\').replace('"','\\"'))
+    b = b.replace('__SAVE_DELAY__', str(float(save_delay)))
     b = b.replace('__REOPEN_DELAY__', str(float(reopen_delay)))
+    b = b.replace('__SETTINGS_JSON__', 'json.loads(%r)' % json.dumps(settings or {}, ensure_ascii=False))
     return b
 
+@_profiled_build
 def _build_ensure_project_async_poll(job_id: str) -> str:
-    b = REMOTE_ENSURE_PROJECT_ASYNC_POLL
+    b = _state_store_prelude() + REMOTE_ENSURE_PROJECT_ASYNC_POLL
     b = b.replace('__JOB_ID__', (job_id or '').replace('\\', '\\\\').replace('"','\\"'))
     return b
 
-def _build_remote_apply_block(ts_name: str, key_to_path: dict) -> str:
-    block = REMOTE_APPLY_TEMPLATE
+@_profiled_build
+def _build_remote_apply_block(ts_name: str, key_to_path: dict, shared=None, resolution=None) -> str:
+    block = _state_store_prelude() + REMOTE_APPLY_TEMPLATE.replace('__FILL_META_COMMON__', REMOTE_FILL_META_COMMON)
     block = block.replace('__VERSION__', VERSION)
     block = block.replace('__TEX_SET_NAME__', ts_name.replace('\\','\\\\').replace('"','\\"'))
     block = block.replace('__KEY_TO_PATH_JSON__', json.dumps(key_to_path, ensure_ascii=False))
+    block = block.replace('__FILL_TAG_PREFIX__', FILL_TAG_PREFIX)
+    block = block.replace('__SHARED_JSON__', 'json.loads(%r)' % json.dumps(shared or {}, ensure_ascii=False))
+    block = block.replace('__TS_RESOLUTION__', str(int(resolution)) if resolution else 'None')
     return block
 
-def main():
-    if len(sys.argv) < 2:
-        print('Usage: run_painter_job.py job.json', flush=True)
-        return 1
-    job_json = os.path.abspath(sys.argv[1])
-    with open(job_json, 'r', encoding='utf-8-sig') as f:
-        job = json.load(f)
-    painter_exe = _clean(job.get('painterExePath'))
+@_profiled_build
+def _build_export_fingerprint_block(preset_exact: str, preset_hint: str, auto_detect: bool) -> str:
+    block = REMOTE_EXPORT_FINGERPRINT_TEMPLATE
+    block = block.replace('__VERSION__', VERSION)
+    block = block.replace('__PRESET_EXACT__', (preset_exact or '').replace('\\','\\\\').replace('"','\\"'))
+    block = block.replace('__PRESET_HINT__', (preset_hint or '').replace('\\','\\\\').replace('"','\\"'))
+    block = block.replace('__AUTO_DETECT__', 'True' if auto_detect else 'False')
+    return block
+
+@_profiled_build
+def _build_export_block(config: dict) -> str:
+    block = REMOTE_EXPORT_TEMPLATE
+    block = block.replace('__VERSION__', VERSION)
+    # json.dumps output is a valid Python literal apart from true/false/null
+    cfg = json.dumps(config, ensure_ascii=False)
+    block = block.replace('__EXPORT_CONFIG_JSON__', 'json.loads(%r)' % cfg)
+    return block
+
+_SHA256_MEMO = {}
+
+def _file_sha256(path, chunk=1024 * 1024):
+    # journal, shared library and export manifest all hash the same inputs; hash each file version once
+    st = os.stat(path)
+    memo_key = (_norm_path(os.path.abspath(path)), st.st_mtime_ns, st.st_size)
+    if memo_key in _SHA256_MEMO:
+        return _SHA256_MEMO[memo_key]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            b = f.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    _SHA256_MEMO[memo_key] = h.hexdigest()
+    return _SHA256_MEMO[memo_key]
+
+def _load_json_file(path):
+    try:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def _export_params(job):
+    params = {'fileFormat': _clean(job.get('exportFileFormat')) or 'png'}
+    bit_depth = _clean(str(job.get('exportBitDepth') or ''))
+    if bit_depth:
+        params['bitDepth'] = bit_depth
+    padding = _clean(job.get('exportPaddingAlgorithm'))
+    if padding:
+        params['paddingAlgorithm'] = padding
+    return params
+
+def _spp_sig(spp):
+    """mtime:size of the saved project; paint strokes are not in the stack fingerprint, so a saved edit shows up here."""
+    try:
+        st = os.stat(spp)
+        return f'{st.st_mtime_ns}:{st.st_size}'
+    except (OSError, TypeError):
+        return None
+
+def _export_entry_current(entry, fingerprint, preset_url, params, spp_sig=None):
+    """True when the manifest entry matches the stack fingerprint and the saved .spp, and every output is unchanged on disk."""
+    if not isinstance(entry, dict):
+        return False
+    if entry.get('fingerprint') != fingerprint or entry.get('preset_url') != preset_url:
+        return False
+    if spp_sig is None or entry.get('spp_sig') != spp_sig:
+        return False
+    if entry.get('params') != params:
+        return False
+    outputs = entry.get('outputs') or {}
+    if not outputs:
+        return False
+    for path, digest in outputs.items():
+        if not os.path.isfile(path):
+            return False
+        try:
+            if _file_sha256(path) != digest:
+                return False
+        except Exception:
+            return False
+    return True
+
+def _run_export_stage(remote, job, ts_names, export_folder, local_log, apply_log, metrics=None):
+    """Export every stale TextureSet with a single export config; returns an exit code (0 = ok)."""
+    manifest_path = os.path.join(export_folder, 'painter_export_manifest.json')
+    manifest = _load_json_file(manifest_path) or {}
+    entries = manifest.get('texture_sets') if isinstance(manifest.get('texture_sets'), dict) else {}
+    params = _export_params(job)
+
+    fp_block = _build_export_fingerprint_block(
+        _clean(job.get('exportPresetExactName')),
+        _clean(job.get('exportPresetNameHint')),
+        bool(job.get('autoDetectExportPreset', True)),
+    )
+    fp_raw = _remote_exec_block(remote, fp_block, 'export_fingerprint', local_log, timeout=300)
+    fp_obj = _normalize_remote_json(fp_raw) or {}
+    _append(apply_log, 'export_fingerprint=' + json.dumps(fp_obj, ensure_ascii=False)[:4000])
+    preset_url = fp_obj.get('preset_url')
+    fingerprints = fp_obj.get('fingerprints') or {}
+    if not preset_url:
+        exact = _clean(job.get('exportPresetExactName'))
+        _log(local_log, '[export] No export preset resolved' + (f' (exportPresetExactName "{exact}" not found)' if exact else '')
+             + '; skipping export')
+        return 20
+    _log(local_log, f"[export] preset={fp_obj.get('preset')} via={fp_obj.get('preset_via')}")
+
+    spp_sig = _spp_sig(_clean(job.get('outputProjectPath')))
+    stale = []
+    for name in ts_names:
+        fp = fingerprints.get(name)
+        if fp and _export_entry_current(entries.get(name), fp, preset_url, params, spp_sig):
+            _log(local_log, f'[export] up to date: {name}')
+            if metrics is not None:
+                metrics.setdefault('skipped_steps', []).append('export:' + name)
+        else:
+            stale.append(name)
+    if not stale:
+        _log(local_log, '[export] All TextureSets up to date; nothing to export')
+        return 0
+
+    config = {
+        'exportShaderParams': False,
+        'exportPath': export_folder,
+        'defaultExportPreset': preset_url,
+        'exportList': [{'rootPath': name} for name in stale],
+        'exportParameters': [{'parameters': params}],
+    }
+    _log(local_log, f'[export] exporting {len(stale)} TextureSet(s): {stale}')
+    raw = _remote_exec_block(remote, _build_export_block(config), 'export_textures', local_log, timeout=1800)
+    obj = _normalize_remote_json(raw)
+    out_path = os.path.join(export_folder, f'painter_export_{VERSION}.json')
+    _write_text(out_path, json.dumps(obj if obj is not None else {'_version': VERSION, '_raw': raw}, ensure_ascii=False, indent=2) + '\n')
+    _append(apply_log, f'export_saved={out_path}')
+    if not isinstance(obj, dict) or obj.get('errors') or obj.get('_remote_error'):
+        _log(local_log, '[export] ERROR (see ' + out_path + ')')
+        return 21
+
+    textures = obj.get('textures') or {}
+    for name in stale:
+        outputs = {}
+        for p in textures.get(name) or []:
+            try:
+                outputs[os.path.normpath(p)] = _file_sha256(p)
+            except Exception as e:
+                _append(apply_log, f'export_hash_failed={p}: {e}')
+        entries[name] = {
+            'fingerprint': fingerprints.get(name),
+            'preset_url': preset_url,
+            'params': params,
+            'spp_sig': spp_sig,
+            'outputs': outputs,
+            'ts': int(time.time()),
+        }
+        _log(local_log, f'[export] {name}: {len(outputs)} file(s)')
+    manifest = {'_version': VERSION, 'texture_sets': entries}
+    _write_text(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2) + '\n')
+    return 0
+
+PAINTER_PROCESS_NAME = 'Substance 3D Painter'
+
+@contextmanager
+def _phase(metrics, sampler, name):
+    """Record wall time (and Painter CPU/RSS when sampled) for one runner phase."""
+    t0 = time.time()
+    if sampler is not None:
+        sampler.set_phase(name)
+    try:
+        yield
+    finally:
+        t1 = time.time()
+        entry = {'name': name, 'start': round(t0, 3), 'end': round(t1, 3), 'duration_sec': round(t1 - t0, 3)}
+        if sampler is not None:
+            sampler.sample()
+            entry['painter'] = sampler.summary(name)
+            sampler.set_phase(None)
+        metrics['phases'].append(entry)
+
+def _recycle_reason(job, rss_mb, jobs_served):
+    max_rss = float(job.get('recycleMaxRssMB') or 0)
+    max_jobs = int(job.get('recycleMaxJobs') or 0)
+    if max_rss > 0 and rss_mb is not None and rss_mb >= max_rss:
+        return f'rss {rss_mb:.0f}MB >= {max_rss:.0f}MB'
+    if max_jobs > 0 and jobs_served is not None and jobs_served >= max_jobs:
+        return f'jobs_served {jobs_served} >= {max_jobs}'
+    return None
+
+def _painter_rss_mb(pid):
+    st = lib_process.read_process_stats(pid)
+    return st['rss'] / 1048576.0 if st else None
+
+def _close_painter(remote, pid, local_log, timeout_sec=120, proc=None):
+    """Ask Painter to close, wait for the process to exit, terminate it as a last resort.
+
+    proc is the Popen handle when the runner started this very pid; waiting on it
+    also reaps the child, which otherwise lingers as a zombie that looks alive."""
+    _remote_exec_block(remote, REMOTE_CLOSE_PAINTER, 'close_painter', local_log, timeout=60)
+    t0 = time.time()
+    own = proc is not None and pid and proc.pid == pid
+    if own:
+        try:
+            proc.wait(timeout_sec)
+        except subprocess.TimeoutExpired:
+            pass
+    else:
+        while pid and lib_process.is_alive(pid) and time.time() - t0 < timeout_sec:
+            time.sleep(1.0)
+    if pid and (proc.poll() is None if own else lib_process.is_alive(pid)):
+        _log(local_log, f'[recycle] Painter pid={pid} still alive after {timeout_sec}s; terminating')
+        try:
+            if sys.platform == 'win32':
+                subprocess.run(['taskkill', '/PID', str(pid), '/T', '/F'], capture_output=True, timeout=30)
+            else:
+                os.kill(pid, 15)
+        except Exception as e:
+            _log(local_log, f'[recycle] terminate failed: {e}')
+    _log(local_log, f'[recycle] Painter closed after {time.time() - t0:.1f}s')
+
+RESOLUTION_TIERS = (256, 512, 1024, 2048, 4096, 8192)
+
+def _resolution_tier(size, lo=256, hi=4096):
+    """Smallest tier holding size, clamped to [lo, hi]."""
+    tier = next((t for t in RESOLUTION_TIERS if t >= size), RESOLUTION_TIERS[-1])
+    return max(lo, min(hi, tier))
+
+def _parse_resolution(value, default=None):
+    """Resolution tier from 2048 / "2048" / "2K" (snapped up to the next tier), or default if unreadable."""
+    try:
+        v = str(value).strip().lower().replace('px', '')
+        n = float(v[:-1]) * 1024 if v.endswith('k') else float(v)
+    except (TypeError, ValueError):
+        return default
+    if n <= 0:
+        return default
+    return _resolution_tier(int(n), RESOLUTION_TIERS[0], RESOLUTION_TIERS[-1])
+
+def _texture_set_resolutions(job):
+    """TextureSet -> resolution tier of its largest input texture (sets with no readable texture are left out)."""
+    lo = _parse_resolution(job.get('documentResolutionMin', 256), 256)
+    hi = _parse_resolution(job.get('documentResolutionMax', 4096), 4096)
+    out = {}
+    for (ts_name, key_to_path) in _extract_texture_sets(job):
+        sizes = [lib_image.image_size(p) for p in key_to_path.values() if os.path.isfile(p)]
+        dims = [max(sz) for sz in sizes if sz]
+        if dims:
+            out[ts_name] = _resolution_tier(max(dims), lo, hi)
+    return out
+
+def _project_settings(job):
+    """project.create settings from job.json, plus per-TextureSet resolutions when documentResolution is "auto"."""
+    settings = {}
+    per_set = {}
+    res = job.get('documentResolution', 'auto')
+    fixed = _parse_resolution(res) if res and str(res).lower() != 'auto' else None
+    if fixed:
+        settings['default_texture_resolution'] = fixed
+    elif res:
+        # "auto", or a value that is not a resolution (e.g. a typo) rather than a crash or a non-tier size
+        per_set = _texture_set_resolutions(job)
+        if per_set:
+            settings['default_texture_resolution'] = max(per_set.values())
+    if _clean(job.get('normalMapFormat')):
+        settings['normal_map_format'] = _clean(job.get('normalMapFormat'))
+    workflow = _clean(job.get('projectWorkflow')) or ('UVTile' if job.get('useUDIM') else '')
+    if workflow:
+        settings['project_workflow'] = workflow
+    if _clean(job.get('tangentSpace')):
+        settings['tangent_space_mode'] = _clean(job.get('tangentSpace'))
+    template = _clean(job.get('templateSptPath'))
+    if template and os.path.isfile(template):
+        settings['template_file_path'] = template
+    return settings, per_set
+
+def _ensure_project(remote, job, local_log, apply_log):
+    """Create + save_as + reopen the project through the async job; returns the final job state."""
     out_spp = _clean(job.get('outputProjectPath'))
-    export_folder = _clean(job.get('exportFolder'))
     mesh_path = _clean(job.get('meshPath'))
     save_delay = float(job.get('saveDelaySec', 3.0))
     reopen_delay = float(job.get('reopenDelaySec', 1.5))
-    if not export_folder:
-        print('exportFolder missing in job.json', flush=True)
-        return 2
-    _ensure_dir(export_folder)
-    local_log = os.path.join(export_folder, 'job_runner.local.log')
-    apply_log = os.path.join(export_folder, 'painter_remote_apply.log')
-    _log(local_log, f'=== START {VERSION} ===')
-    _log(local_log, f'JOB_JSON={job_json}')
-    _log(local_log, f'PainterExe={painter_exe}')
-    _log(local_log, f'OutputSPP={out_spp}')
-    _log(local_log, f'MeshPath={mesh_path}')
-    _log(local_log, f'ExportFolder={export_folder}')
-    _log(local_log, f'saveDelaySec={save_delay}')
-    _log(local_log, f'reopenDelaySec={reopen_delay}')
-    _write_text(apply_log, f'=== START painter_remote_apply.log ({VERSION}) ===\n')
-    _append(apply_log, f'JOB_JSON={job_json}')
-    _append(apply_log, f'OutputSPP={out_spp}')
-    _append(apply_log, f'MeshPath={mesh_path}')
-    _append(apply_log, f'saveDelaySec={save_delay}')
-    _append(apply_log, f'reopenDelaySec={reopen_delay}')
-    # Check if Painter is already running (port conflict prevention)
-    already_running = _is_painter_running()
-    if already_running:
-        _log(local_log, '[WARN] Painter is already running! Trying to connect to existing instance...')
-        _log(local_log, '[WARN] If connection fails, close all Painter instances and retry.')
-        _append(apply_log, '[WARN] Painter already running - using existing instance')
-    else:
-        _start_painter(painter_exe, out_spp, local_log)
-    remote = lib_remote.RemotePainter()
-    _wait_remote(remote, local_log)
     _append(apply_log, 'Ensuring project open/create/save_as (remote)...')
+    settings, _ = _project_settings(job)
+    _log(local_log, f'[ensure_project] settings={json.dumps(settings, ensure_ascii=False)}')
     # Start ensure project job (returns quickly)
-    ensure_start = _build_ensure_project_async_start(mesh_path, out_spp, save_delay, reopen_delay)
+    ensure_start = _build_ensure_project_async_start(
+        mesh_path, out_spp, save_delay, reopen_delay,
+        store_ttl=job.get('stateStoreTtlSec'), store_max=job.get('stateStoreMaxEntries'), settings=settings)
     start_raw = _remote_exec_block(remote, ensure_start, 'ensure_project_start', local_log, timeout=30)
     start_obj = _normalize_remote_json(start_raw) or {}
     job_id = start_obj.get('job_id')
     _append(apply_log, 'ensure_project_job_id=' + str(job_id))
+    if settings or start_obj.get('errors'):
+        _log(local_log, f"[ensure_project] settings applied={json.dumps(start_obj.get('settings_applied'), ensure_ascii=False)}")
+    for err in start_obj.get('errors') or []:
+        _log(local_log, f'[ensure_project] ERROR {err}')
     if not job_id:
         _append(apply_log, 'ensure_project_start_raw=' + str(start_raw)[:2000])
         raise RuntimeError('ensure_project_start_no_job_id')
 
-
     # Poll until done/error
     t0 = time.time()
     timeout_sec = 900  # 15 min max for heavy FBX
@@ -887,10 +2227,9 @@ def main():
             break
         time.sleep(1.0)
 
-    
     # If create finished, run save_as on main (separate remote call)
     if isinstance(final_state, dict) and final_state.get('status') == 'ready_for_save':
-        save_block = REMOTE_ENSURE_PROJECT_ASYNC_SAVE.replace('__JOB_ID__', str(job_id)).replace('__SPP__', out_spp).replace('__SAVE_DELAY__', str(save_delay)).replace('__REOPEN_DELAY__', str(reopen_delay))
+        save_block = (_state_store_prelude() + REMOTE_ENSURE_PROJECT_ASYNC_SAVE).replace('__JOB_ID__', str(job_id)).replace('__SPP__', out_spp).replace('__SAVE_DELAY__', str(save_delay)).replace('__REOPEN_DELAY__', str(reopen_delay))
         save_raw = _remote_exec_block(remote, save_block, 'ensure_project_save', local_log, timeout=120)
         save_obj = _normalize_remote_json(save_raw) or {}
         _append(apply_log, 'ensure_project_save=' + json.dumps(save_obj, ensure_ascii=False))
@@ -900,6 +2239,580 @@ def main():
         final_state = _normalize_remote_json(poll_raw) or final_state
 
     _append(apply_log, 'ensure_project_result=' + json.dumps(final_state, ensure_ascii=False))
+    # Result is consumed; drop the job state (including traces) from the Painter-side store
+    if isinstance(final_state, dict) and final_state.get('status') != 'timeout':
+        rel = _normalize_remote_json(_remote_exec_block(remote, _build_state_release(str(job_id)), 'state_release', local_log, timeout=20))
+        _append(apply_log, 'state_release=' + json.dumps(rel, ensure_ascii=False))
+    return final_state
+
+def _wait_texture_sets(remote, local_log, apply_log):
+    _append(apply_log, 'Waiting texture sets to be ready (remote)...')
+    wait_block = REMOTE_WAIT_TEXTURESETS.replace('__VERSION__', VERSION)
+    wait_raw = _remote_exec_block(remote, wait_block, 'wait_texturesets', local_log, timeout=600)
+    _append(apply_log, 'wait_texturesets_return=' + str(wait_raw)[:4000])
+    return _normalize_remote_json(wait_raw)
+
+def _safe_name(name):
+    return name.replace(':','_').replace('/','_').replace('\\','_').replace(' ','_')
+
+APPLY_TIMEOUT_SEC = 1800
+
+def _save_apply_result(export_folder, ts_name, raw, apply_log):
+    safe = _safe_name(ts_name)
+    raw_path = os.path.join(export_folder, f'painter_apply_{safe}_RAW.txt')
+    _write_text(raw_path, (raw if isinstance(raw,str) else str(raw)) + '\n')
+    _append(apply_log, f'apply_raw_saved={raw_path}')
+    # raw is either a reply the caller already parsed (and timed) or JSON built locally:
+    # decode it without charging the parse to the last remote call
+    obj = _decode_remote_json(raw)
+    out_path = os.path.join(export_folder, f'painter_apply_{safe}_{VERSION}.json')
+    if obj is None:
+        _write_text(out_path, json.dumps({'_version':VERSION,'_raw':raw}, ensure_ascii=False, indent=2) + '\n')
+        _append(apply_log, f'apply_saved_rawwrap={out_path}')
+    else:
+        _write_text(out_path, json.dumps(obj, ensure_ascii=False, indent=2) + '\n')
+        _append(apply_log, f'apply_saved={out_path}')
+    return obj
+
+def _apply_one_texture_set(remote, ts_name, key_to_path, export_folder, local_log, apply_log, timeout_sec=APPLY_TIMEOUT_SEC,
+                           shared=None, resolution=None):
+    """Start the apply job in Painter and poll it, persisting per-texture progress as it arrives."""
+    block = _build_remote_apply_block(ts_name, key_to_path, shared, resolution)
+    start_raw = _remote_exec_block(remote, block, f'apply_start_{ts_name}', local_log, timeout=120)
+    start = _normalize_remote_json(start_raw)
+    job_id = start.get('job_id') if isinstance(start, dict) else None
+    if not job_id:
+        return _save_apply_result(export_folder, ts_name, start_raw, apply_log)
+    progress_path = os.path.join(export_folder, f'painter_apply_{_safe_name(ts_name)}_PROGRESS.json')
+    t0 = time.time()
+    seen = 0
+    st = None
+    while True:
+        # a slow import blocks Painter's main thread, so polls get a generous timeout
+        poll = _normalize_remote_json(_remote_exec_block(remote, _build_job_poll(job_id), f'apply_poll_{ts_name}', local_log, timeout=300))
+        if isinstance(poll, dict) and poll.get('job_id') == job_id:
+            st = poll
+            prog = st.get('progress') or []
+            if len(prog) > seen:
+                for p in prog[seen:]:
+                    times = ' '.join(f"{k[:-4]}={p[k]}s" for k in ('import_sec', 'rid_sec', 'bind_sec', 'total_sec') if p.get(k) is not None)
+                    _log(local_log, f"[apply] {ts_name} {p.get('key')}: {p.get('status')} ({times})"
+                                    + (f" err={p.get('err')}" if p.get('err') else ''))
+                seen = len(prog)
+                _write_text(progress_path, json.dumps(st, ensure_ascii=False, indent=2) + '\n')
+            if st.get('status') in ('done', 'error', 'cancelled'):
+                break
+        if time.time() - t0 > timeout_sec:
+            _log(local_log, f'[apply] {ts_name} TIMEOUT after {timeout_sec}s ({seen} textures done); cancelling')
+            _remote_exec_block(remote, _build_job_cancel(job_id), f'apply_cancel_{ts_name}', local_log, timeout=60)
+            break
+        time.sleep(0.5)
+    if isinstance(st, dict):
+        _write_text(progress_path, json.dumps(st, ensure_ascii=False, indent=2) + '\n')
+    result = st.get('result') if isinstance(st, dict) else None
+    if result is None:
+        # timed out: keep what completed so far
+        result = {'_version': VERSION, 'textureset': ts_name, 'status': 'timeout',
+                  'progress': (st or {}).get('progress') or [], 'errors': ['apply_timeout']}
+    else:
+        _remote_exec_block(remote, _build_state_release(job_id), f'apply_release_{ts_name}', local_log, timeout=20)
+    if isinstance(st, dict) and st.get('error'):
+        _log(local_log, f"[apply] {ts_name} ERROR {st.get('error')}")
+    return _save_apply_result(export_folder, ts_name, json.dumps(result, ensure_ascii=False), apply_log)
+
+SETUP_SPANS = ('ts_lookup', 'set_resolution', 'channels', 'fill_lookup', 'insert_fill')
+TEXTURE_SPANS = ('unchanged_check', 'import_texture', 'resource_id', 'set_source')
+
+def _apply_span_report(ts_name, key_to_path, obj, local_log):
+    """Merge the remote spans of one apply with each texture's file size and pixel count."""
+    setup = {}
+    per_key = {}
+    for row in obj.get('spans') or []:
+        try:
+            step, key, _, dur_ms = row
+        except (TypeError, ValueError):
+            continue
+        if key is None:
+            setup[step] = round(setup.get(step, 0.0) + dur_ms, 2)
+        else:
+            per_key.setdefault(key, {})[step] = dur_ms
+    textures = []
+    for item in obj.get('imports') or []:
+        key, path = item.get('key'), item.get('path') or key_to_path.get(item.get('key'))
+        size = os.path.getsize(path) if path and os.path.isfile(path) else None
+        dims = lib_image.image_size(path) if size is not None else None
+        row = {'key': key, 'path': path, 'bytes': size, 'pixels': dims[0] * dims[1] if dims else None,
+               'via': item.get('import_via'), 'ms': per_key.get(key, {})}
+        imp = row['ms'].get('import_texture')
+        if imp and row['bytes']:
+            row['import_mb_per_s'] = round(row['bytes'] / 1048576.0 / (imp / 1000.0), 2)
+        if imp and row['pixels']:
+            row['import_mpix_per_s'] = round(row['pixels'] / 1e6 / (imp / 1000.0), 2)
+        textures.append(row)
+    _log(local_log, f"[spans] {ts_name} setup " + ' '.join(f'{k}={setup[k]}ms' for k in SETUP_SPANS if k in setup))
+    for row in textures:
+        size = f"{row['bytes'] / 1048576.0:.2f}MB" if row['bytes'] is not None else '?MB'
+        pix = f"{row['pixels'] / 1e6:.2f}MP" if row['pixels'] is not None else '?MP'
+        _log(local_log, f"[spans] {ts_name} {row['key']} ({size}, {pix}) "
+                        + ' '.join(f"{k}={row['ms'][k]}ms" for k in TEXTURE_SPANS if k in row['ms']))
+    return {'setup_ms': setup, 'textures': textures}
+
+def _apply_complete(key_to_path, obj):
+    """True when every texture of the set is bound, so a resume may skip it. Keys Painter has no
+    channel for can never bind and do not block completion."""
+    if not isinstance(obj, dict) or obj.get('_remote_error') or not obj.get('fill'):
+        return False
+    items = {i.get('key'): i for i in obj.get('imports') or [] if isinstance(i, dict)}
+    for k in key_to_path:
+        i = items.get(k)
+        if i is None or not (i.get('set_ok') or i.get('set_err') == 'channeltype_not_found_for_key'):
+            return False
+    return True
+
+def _apply_texture_sets(remote, tsets, export_folder, local_log, apply_log, journal=None, session_id=None, library=None,
+                        resolutions=None, metrics=None):
+    """Apply each TextureSet; returns the names of sets that did not bind completely."""
+    incomplete = []
+    for (ts_name, key_to_path) in tsets:
+        _append(apply_log, f'--- APPLY TextureSet={ts_name} keys={list(key_to_path.keys())} ---')
+        if journal is not None:
+            _journal_write(journal, 'begin', 'apply:' + ts_name)
+        shared = None
+        if library is not None:
+            shared = {p: library['shared'][p] for p in key_to_path.values() if p in library['shared']}
+        obj = _apply_one_texture_set(remote, ts_name, key_to_path, export_folder, local_log, apply_log, shared=shared,
+                                     resolution=(resolutions or {}).get(ts_name))
+        if library is not None and isinstance(obj, dict):
+            _shared_library_record(library, obj)
+        if metrics is not None and isinstance(obj, dict) and obj.get('channeltype_members'):
+            metrics['channeltype_members'] = obj['channeltype_members']
+        if isinstance(obj, dict) and obj.get('spans'):
+            report = _apply_span_report(ts_name, key_to_path, obj, local_log)
+            if metrics is not None:
+                metrics.setdefault('apply_spans', {})[ts_name] = report
+        if not _apply_complete(key_to_path, obj):
+            incomplete.append(ts_name)
+        elif journal is not None:
+            _journal_write(journal, 'done', 'apply:' + ts_name, session_id=session_id,
+                           inputs_hash=journal['inputs'].get(ts_name) or _texture_set_hash(key_to_path))
+    return incomplete
+
+SHARED_INDEX_NAME = 'painter_shared_index.json'
+SHARED_SEEN_TTL_SEC = 30 * 86400
+
+SHARED_LOCK_TIMEOUT_SEC = 30.0
+SHARED_LOCK_STALE_SEC = 120.0
+
+def _shared_index_save(path, index):
+    """Merge index with the copy on disk (other runners of the batch) and replace the file atomically.
+
+    Serialized through <index>.lock; entries keep the most recently used record per hash and
+    sightings the most recent one, so concurrent runners never drop each other's hash -> URL pairs."""
+    lock = path + '.lock'
+    fd = None
+    t0 = time.time()
+    while fd is None:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > SHARED_LOCK_STALE_SEC:
+                    os.remove(lock)  # left behind by a killed runner
+                    continue
+            except OSError:
+                continue
+            if time.time() - t0 > SHARED_LOCK_TIMEOUT_SEC:
+                break  # write anyway: the replace below is still atomic
+            time.sleep(0.1)
+    try:
+        disk = _load_json_file(path)
+        if isinstance(disk, dict):
+            for kind, stamp in (('entries', 'last_used'), ('seen', 't')):
+                mine = index.setdefault(kind, {})
+                for h, rec in (disk.get(kind) or {}).items():
+                    if h not in mine or (rec or {}).get(stamp, 0) > (mine[h] or {}).get(stamp, 0):
+                        mine[h] = rec
+        # expire old sightings after the merge, so another runner's copy cannot bring them back
+        now = time.time()
+        seen, entries = index.setdefault('seen', {}), index.setdefault('entries', {})
+        for h in [h for h, v in seen.items() if now - (v or {}).get('t', 0) > SHARED_SEEN_TTL_SEC and h not in entries]:
+            del seen[h]
+        tmp = '%s.tmp-%d' % (path, os.getpid())
+        _write_text(tmp, json.dumps(index, ensure_ascii=False, indent=2))
+        os.replace(tmp, path)
+    finally:
+        if fd is not None:
+            os.close(fd)
+            try:
+                os.remove(lock)
+            except OSError:
+                pass
+
+def _shared_library_plan(job, tsets, local_log):
+    """Pick the textures to resolve through the shared library: flagged "shared" in job.json,
+    repeated within this job, or already seen by another project of the batch."""
+    folder = _clean(job.get('sharedLibraryFolder'))
+    if not folder:
+        return None
+    _ensure_dir(folder)
+    index_path = os.path.join(folder, SHARED_INDEX_NAME)
+    index = _load_json_file(index_path)
+    if not isinstance(index, dict):
+        index = {}
+    entries = index.setdefault('entries', {})
+    seen = index.setdefault('seen', {})
+    flagged = set()
+    for src in [job] + [v for v in job.get('variants') or [] if isinstance(v, dict)]:
+        for ts in src.get('textureSets') or []:
+            for t in (ts.get('textures') or []) if isinstance(ts, dict) else []:
+                if isinstance(t, dict) and t.get('shared'):
+                    flagged.add(_norm_path(_clean(t.get('value')) or _clean(t.get('path'))))
+    uses = {}
+    hashes = {}
+    for (_, key_to_path) in tsets:
+        for p in key_to_path.values():
+            if not os.path.isfile(p):
+                continue
+            if p not in hashes:
+                hashes[p] = _file_sha256(p)
+            uses[hashes[p]] = uses.get(hashes[p], 0) + 1
+    auto = bool(job.get('sharedLibraryAutoDetect', True))
+    shelf = _clean(job.get('sharedLibraryShelf')) or 'unity_shared'
+    project_key = _norm_path(_clean(job.get('outputProjectPath')))
+    now = time.time()
+    shared = {}
+    for p, h in hashes.items():
+        other_project = h in seen and seen[h].get('spp') != project_key
+        if _norm_path(p) in flagged or (auto and (uses[h] > 1 or other_project or h in entries)):
+            shared[p] = {'hash': h, 'url': (entries.get(h) or {}).get('url'), 'shelf': shelf, 'folder': folder}
+        seen[h] = {'t': round(now, 3), 'spp': project_key}
+    # persist the sightings now: a job without shared textures must still mark its hashes as used
+    _shared_index_save(index_path, index)
+    _log(local_log, f'[library] {len(shared)} of {len(hashes)} texture(s) via shared library ({shelf}); index={len(entries)} entries')
+    return {'path': index_path, 'index': index, 'shared': shared}
+
+def _shared_library_record(library, apply_obj):
+    """Store hash -> resource URL for shared textures the apply bound, and persist the index."""
+    entries = library['index']['entries']
+    changed = False
+    for item in apply_obj.get('imports') or []:
+        h, url = item.get('shared_hash'), item.get('shared_url')
+        if not h or not url:
+            continue
+        e = entries.setdefault(h, {'name': os.path.basename(item.get('path') or ''), 'first_used': round(time.time(), 3), 'uses': 0})
+        e.update(url=url, last_used=round(time.time(), 3))
+        e['uses'] += 1
+        changed = True
+        for p, entry in library['shared'].items():
+            if entry['hash'] == h:
+                entry['url'] = url
+    if changed:
+        _shared_index_save(library['path'], library['index'])
+
+def _run_repack_stage(job, ts_names, export_folder, local_log, apply_log):
+    import repack_textures
+    _append(apply_log, '--- REPACK ---')
+    results = repack_textures.repack_export(
+        export_folder, ts_names,
+        out_dir=_clean(job.get('repackOutputFolder')) or None,
+        workers=job.get('repackWorkers'),
+        normal_directx=bool(job.get('exportNormalDirectX', False)),
+        log=lambda m: _log(local_log, m),
+    )
+    _append(apply_log, 'repack_result=' + json.dumps(results, ensure_ascii=False))
+    return 22 if any(r.get('errors') for r in results) else 0
+
+def _stage_inputs(job):
+    """Copy mesh and textures into the local staging cache; returns (job with staged paths, stats)."""
+    cache = lib_staging.StagingCache(
+        _clean(job.get('stagingFolder')),
+        max_bytes=float(job.get('stagingMaxGB', 20)) * 1024 ** 3,
+        workers=int(job.get('stagingWorkers', 8)),
+    )
+    sources = [_clean(job.get('meshPath'))]
+    for src in [job] + [v for v in job.get('variants') or [] if isinstance(v, dict)]:
+        for (_, key_to_path) in _extract_texture_sets(src):
+            sources.extend(key_to_path.values())
+    t0 = time.perf_counter()
+    staged = cache.stage(sources)
+    for (dst, h) in staged.values():
+        st = os.stat(dst)
+        _SHA256_MEMO[(_norm_path(os.path.abspath(dst)), st.st_mtime_ns, st.st_size)] = h
+
+    def restage(p):
+        p = _clean(p)
+        return staged[p][0] if p in staged else p
+
+    job = copy.deepcopy(job)
+    if job.get('meshPath'):
+        job['meshPath'] = restage(job['meshPath'])
+    for src in [job] + [v for v in job.get('variants') or [] if isinstance(v, dict)]:
+        for ts in src.get('textureSets') or []:
+            for t in (ts.get('textures') or []) if isinstance(ts, dict) else []:
+                for k in ('value', 'path'):
+                    if isinstance(t, dict) and t.get(k):
+                        t[k] = restage(t[k])
+    return job, dict(cache.stats, files=len(staged), sec=round(time.perf_counter() - t0, 3))
+
+def _variant_job(job, variant):
+    """Job for one variant: the base job with the variant's maps merged over its TextureSets, its own
+    .spp (<base>_<variant>.spp) and export folder (<exportFolder>/<variant>)."""
+    name = _safe_name(_clean(variant.get('name')))
+    vjob = copy.deepcopy(job)
+    vjob.pop('variants', None)
+    stem, ext = os.path.splitext(_clean(job.get('outputProjectPath')))
+    vjob['outputProjectPath'] = _clean(variant.get('outputProjectPath')) or f'{stem}_{name}{ext or ".spp"}'
+    vjob['exportFolder'] = _clean(variant.get('exportFolder')) or os.path.join(_clean(job.get('exportFolder')), name)
+    if 'export' in variant:
+        vjob['exportTextures'] = bool(variant['export'])
+    merged = {ts_name: dict(key_to_path) for (ts_name, key_to_path) in _extract_texture_sets(job)}
+    order = list(merged)
+    for (ts_name, key_to_path) in _extract_texture_sets(variant):
+        if ts_name not in merged:
+            order.append(ts_name)
+        merged.setdefault(ts_name, {}).update(key_to_path)
+    vjob['textureSets'] = [{'name': n, 'textures': [{'key': k, 'path': p} for k, p in merged[n].items()]} for n in order]
+    return vjob
+
+def _variant_override_sets(job):
+    """(TextureSet, {key: path}) overrides listed by the variants themselves, without the merged base maps."""
+    out = []
+    for variant in job.get('variants') or []:
+        if isinstance(variant, dict) and _clean(variant.get('name')):
+            out.extend(_extract_texture_sets(variant))
+    return out
+
+def _run_variants(remote, job, local_log, apply_log, metrics, sampler, journal, session_id, library=None):
+    """Apply, save_as and optionally export each variant on the already created project.
+    Returns (exit code, names of variants whose apply did not bind completely).
+
+    library is the base job's shared-library plan (planned over the variants' maps too, under the base
+    project key), so a variant's own .spp never makes the base textures look used by another project."""
+    rc = 0
+    incomplete_variants = []
+    for variant in job.get('variants') or []:
+        if not isinstance(variant, dict) or not _clean(variant.get('name')):
+            _log(local_log, f'[variant] skipping entry without a name: {variant!r}')
+            continue
+        vjob = _variant_job(job, variant)
+        name = _clean(variant.get('name'))
+        vspp = vjob['outputProjectPath']
+        vexport = vjob['exportFolder']
+        _ensure_dir(vexport)
+        vsets = _extract_texture_sets(vjob)
+        inputs_hash = hashlib.sha256(json.dumps(
+            [[n, _texture_set_hash(k2p)] for (n, k2p) in vsets]).encode('utf-8')).hexdigest()
+        step = 'variant:' + name
+        rec = journal['done'].get(step)
+        if rec and rec.get('inputs_hash') == inputs_hash and os.path.isfile(vspp):
+            _log(local_log, f'[journal] skip variant {name} (already saved)')
+            metrics.setdefault('skipped_steps', []).append(step)
+            continue
+        _journal_write(journal, 'begin', step)
+        _log(local_log, f'[variant] {name}: {len(vsets)} TextureSet(s) -> {vspp}')
+        _append(apply_log, f'--- VARIANT {name} ---')
+        _, resolutions = _project_settings(vjob)
+        with _phase(metrics, sampler, 'variant_apply'):
+            # tagged fills are updated in place, so only the maps that differ are re-imported
+            incomplete = _apply_texture_sets(remote, vsets, vexport, local_log, apply_log, session_id=session_id,
+                                             library=library, resolutions=resolutions, metrics=metrics)
+        with _phase(metrics, sampler, 'variant_save'):
+            saved = _normalize_remote_json(_remote_exec_block(remote, _build_save_as(vspp), f'save_as_{name}', local_log, timeout=900)) or {}
+        _append(apply_log, f'variant_save_{name}=' + json.dumps(saved, ensure_ascii=False)[:2000])
+        if not saved.get('saved'):
+            _log(local_log, f"[variant] {name}: save_as FAILED {saved.get('error')}")
+            rc = rc or 23
+            continue
+        if vjob.get('exportTextures', True) and vsets:
+            with _phase(metrics, sampler, 'variant_export'):
+                vrc = _run_export_stage(remote, vjob, [n for (n, _) in vsets], vexport, local_log, apply_log, metrics=metrics)
+                if not vrc and vjob.get('repackForUnity', False):
+                    vrc = _run_repack_stage(vjob, [n for (n, _) in vsets], vexport, local_log, apply_log)
+            if vrc:
+                _log(local_log, f'[variant] {name}: export failed (rc={vrc})')
+                rc = rc or vrc
+                continue
+        if incomplete:
+            # saved with what did bind; left open in the journal so a resume applies it again
+            _log(local_log, f'[variant] {name}: incomplete TextureSet(s) {incomplete}; not journaled as done')
+            incomplete_variants.append(name)
+            continue
+        _journal_write(journal, 'done', step, inputs_hash=inputs_hash, spp_hash=_file_sha256(vspp) if os.path.isfile(vspp) else None)
+    return rc, incomplete_variants
+
+JOURNAL_NAME = 'painter_job_journal.jsonl'
+
+def _norm_path(p):
+    return os.path.normcase(os.path.normpath(p)) if p else ''
+
+def _job_hash(job):
+    return hashlib.sha256(json.dumps(job, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _texture_set_hash(key_to_path):
+    h = hashlib.sha256()
+    for k in sorted(key_to_path):
+        p = key_to_path[k]
+        h.update(f'{k}={p}='.encode('utf-8'))
+        h.update((_file_sha256(p) if os.path.isfile(p) else 'missing').encode('ascii'))
+    return h.hexdigest()
+
+def _journal_write(journal, event, step=None, **extra):
+    """Append one record and fsync it, so a crash never loses an acknowledged step."""
+    rec = {'t': round(time.time(), 3), 'event': event}
+    if step:
+        rec['step'] = step
+    rec.update(extra)
+    _ensure_dir(os.path.dirname(journal['path']))
+    with open(journal['path'], 'a', encoding='utf-8') as f:
+        f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    if event == 'done' and step:
+        journal['done'][step] = rec
+
+def _journal_start(job, local_log):
+    """Open the checkpoint journal in exportFolder; stale or finished journals are rotated to .prev."""
+    path = os.path.join(_clean(job.get('exportFolder')), JOURNAL_NAME)
+    mesh_path = _clean(job.get('meshPath'))
+    header = {
+        'job_hash': _job_hash(job),
+        'mesh_hash': _file_sha256(mesh_path) if mesh_path and os.path.isfile(mesh_path) else None,
+        'spp': _norm_path(_clean(job.get('outputProjectPath'))),
+    }
+    records = []
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except Exception:
+                    break  # torn tail write; keep what precedes it
+    journal = {'path': path, 'done': {}, 'header': header, 'inputs': {}, 'resumed': False}
+    head = records[0] if records and records[0].get('event') == 'header' else None
+    reason = None
+    if head is None:
+        reason = 'no_journal' if not records else 'bad_header'
+    elif any(head.get(k) != v for k, v in header.items()):
+        reason = 'job_or_mesh_changed'
+    elif any(r.get('event') == 'complete' for r in records):
+        reason = 'previous_run_complete'
+    if reason is None:
+        for r in records:
+            if r.get('event') == 'done' and r.get('step'):
+                journal['done'][r['step']] = r
+        journal['resumed'] = True
+        _log(local_log, f"[journal] resuming; completed steps: {sorted(journal['done'])}")
+        _journal_write(journal, 'resume')
+        return journal
+    if os.path.isfile(path):
+        os.replace(path, path + '.prev')
+    _log(local_log, f'[journal] new journal ({reason})')
+    _journal_write(journal, 'header', **header)
+    return journal
+
+def _journal_project_valid(journal, pstate, spp):
+    """True when the journalled ensure_project step can be trusted for the current Painter state."""
+    rec = journal['done'].get('ensure_project')
+    if not rec or not spp or not os.path.isfile(spp):
+        return False
+    if pstate.get('session_id') == rec.get('session_id'):
+        return True
+    try:
+        return _file_sha256(spp) == rec.get('spp_hash')
+    except Exception:
+        return False
+
+def _run_job(job, local_log, apply_log, metrics, sampler):
+    painter_exe = _clean(job.get('painterExePath'))
+    out_spp = _clean(job.get('outputProjectPath'))
+    export_folder = _clean(job.get('exportFolder'))
+    remote = lib_remote.RemotePainter()
+    proc = None
+    # stage inputs while Painter starts up; the staged paths are needed from ensure_project on
+    stager = ThreadPoolExecutor(max_workers=1) if _clean(job.get('stagingFolder')) else None
+    staging = stager.submit(_stage_inputs, job) if stager else None
+    with _phase(metrics, sampler, 'startup'):
+        # Check if Painter is already running (port conflict prevention)
+        already_running = _is_painter_running()
+        if already_running:
+            _log(local_log, '[WARN] Painter is already running! Trying to connect to existing instance...')
+            _log(local_log, '[WARN] If connection fails, close all Painter instances and retry.')
+            _append(apply_log, '[WARN] Painter already running - using existing instance')
+            pids = lib_process.find_pids(PAINTER_PROCESS_NAME)
+            pid = pids[0] if pids else None
+        else:
+            proc = _start_painter(painter_exe, out_spp, local_log)
+            pid = proc.pid
+        sampler.set_pid(pid)
+        sampler.start()
+        _wait_remote(remote, local_log)
+        if proc is not None and proc.poll() is not None:
+            # launcher exited after handing off to the real Painter process
+            pids = lib_process.find_pids(PAINTER_PROCESS_NAME)
+            pid = pids[0] if pids else None
+            sampler.set_pid(pid)
+        store_status = _normalize_remote_json(_remote_exec_block(remote, _build_state_status(), 'state_status', local_log, timeout=20))
+        _append(apply_log, 'state_status_before=' + json.dumps(store_status, ensure_ascii=False))
+        if already_running and isinstance(store_status, dict):
+            reason = _recycle_reason(job, _painter_rss_mb(pid), store_status.get('jobs_served'))
+            if reason:
+                _log(local_log, f'[recycle] Restarting Painter before job: {reason}')
+                metrics['recycled_before'] = reason
+                _close_painter(remote, pid, local_log, proc=proc)
+                proc = _start_painter(painter_exe, out_spp, local_log)
+                pid = proc.pid
+                sampler.set_pid(pid)
+                _wait_remote(remote, local_log)
+    metrics['painter_pid'] = pid
+    if staging is not None:
+        with _phase(metrics, sampler, 'stage_wait'):
+            try:
+                job, stats = staging.result()
+                metrics['staging'] = stats
+                _log(local_log, f"[stage] {stats['files']} file(s): {stats['hits']} cached, {stats['staged']} copied "
+                                f"({stats['bytes_copied'] / 1048576.0:.1f} MB), {stats['evicted']} evicted, {stats['sec']}s")
+                for err in stats['errors']:
+                    _log(local_log, f'[stage] ERROR {err} (using the original path)')
+                _append(apply_log, 'staging=' + json.dumps(stats, ensure_ascii=False))
+            except Exception as e:
+                _log(local_log, f'[stage] FAILED, using original paths: {type(e).__name__}: {e}')
+            finally:
+                stager.shutdown()
+
+    try:
+        metrics['plan_features'] = _plan_job(job)['features']
+    except Exception as e:
+        _log(local_log, f'[plan] features not computed: {e}')
+
+    journal = _journal_start(job, local_log)
+    metrics['resumed'] = bool(journal['resumed'])
+    pstate = _normalize_remote_json(_remote_exec_block(remote, _build_project_state(), 'project_state', local_log, timeout=20)) or {}
+    session_id = pstate.get('session_id')
+    same_project = bool(pstate.get('is_open')) and _norm_path(pstate.get('file_path')) == _norm_path(out_spp)
+    final_state = None
+    if _journal_project_valid(journal, pstate, out_spp):
+        if same_project:
+            _log(local_log, '[journal] skip ensure_project (project already open)')
+            metrics.setdefault('skipped_steps', []).append('ensure_project')
+        else:
+            with _phase(metrics, sampler, 'ensure_project'):
+                _log(local_log, '[journal] skip ensure_project; reopening saved project')
+                opened = _normalize_remote_json(_remote_exec_block(remote, _build_open_project(out_spp), 'open_project', local_log, timeout=900)) or {}
+                _append(apply_log, 'journal_open_project=' + json.dumps(opened, ensure_ascii=False))
+                if opened.get('opened'):
+                    # freshly opened from disk: in-memory applies of any earlier session are gone
+                    same_project = False
+                else:
+                    final_state = _ensure_project(remote, job, local_log, apply_log)
+        if final_state is None:
+            final_state = {'status': 'done', 'step': 'journal_resume'}
+    else:
+        _journal_write(journal, 'begin', 'ensure_project')
+        with _phase(metrics, sampler, 'ensure_project'):
+            final_state = _ensure_project(remote, job, local_log, apply_log)
+        same_project = False
+        if isinstance(final_state, dict) and final_state.get('status') == 'done' and os.path.isfile(out_spp):
+            _journal_write(journal, 'done', 'ensure_project', session_id=session_id, spp_hash=_file_sha256(out_spp))
     if isinstance(final_state, dict) and final_state.get('status') == 'error':
         _log(local_log, '[ensure_project] ERROR')
         _log(local_log, (final_state.get('error') or '')[:2000])
@@ -908,57 +2821,412 @@ def main():
     if isinstance(final_state, dict) and final_state.get('status') == 'timeout':
         return 11
 
-    _append(apply_log, 'Waiting texture sets to be ready (remote)...')
-    wait_block = r'''
-import json, time
-OUT_OBJ={'_version':'__VERSION__','_ts':int(time.time()),'tries':[],'ok':False,'count':0,'names':[]}
-try:
-  import substance_painter.textureset as textureset
-except Exception as e:
-  OUT_OBJ['tries'].append({'i':0,'err':'import_failed:'+str(e)})
-  OUT=json.dumps(OUT_OBJ, ensure_ascii=False)
-else:
-  for i in range(20):
-    try:
-      ts=list(textureset.all_texture_sets())
-      names=[]
-      for t in ts:
-        try: names.append(t.name())
-        except Exception: names.append(str(t))
-      OUT_OBJ['tries'].append({'i':i,'count':len(ts),'names':names})
-      if len(ts)>0:
-        OUT_OBJ['ok']=True; OUT_OBJ['count']=len(ts); OUT_OBJ['names']=names
-        break
-    except Exception as e:
-      OUT_OBJ['tries'].append({'i':i,'err':str(e)})
-    time.sleep(0.5)
-  OUT=json.dumps(OUT_OBJ, ensure_ascii=False)
-'''
-    wait_block = wait_block.replace('__VERSION__', VERSION)
-    wait_raw = _remote_exec_block(remote, wait_block, 'wait_texturesets', local_log, timeout=600)
-    _append(apply_log, 'wait_texturesets_return=' + str(wait_raw)[:4000])
+    with _phase(metrics, sampler, 'wait_texturesets'):
+        _wait_texture_sets(remote, local_log, apply_log)
     tsets = _extract_texture_sets(job)
     _append(apply_log, f'textureSets_count={len(tsets)}')
+    # Applied sets live only in Painter memory; trust them only within the same session and open project
+    pending = []
     for (ts_name, key_to_path) in tsets:
-        _append(apply_log, f'--- APPLY TextureSet={ts_name} keys={list(key_to_path.keys())} ---')
-        block = _build_remote_apply_block(ts_name, key_to_path)
-        raw = _remote_exec_block(remote, block, f'apply_{ts_name}', local_log, timeout=1800)
-        safe = ts_name.replace(':','_').replace('/','_').replace('\\','_').replace(' ','_')
-        raw_path = os.path.join(export_folder, f'painter_apply_{safe}_RAW.txt')
-        _write_text(raw_path, (raw if isinstance(raw,str) else str(raw)) + '\n')
-        _append(apply_log, f'apply_raw_saved={raw_path}')
-        obj = _normalize_remote_json(raw)
-        out_path = os.path.join(export_folder, f'painter_apply_{safe}_{VERSION}.json')
-        if obj is None:
-            _write_text(out_path, json.dumps({'_version':VERSION,'_raw':raw}, ensure_ascii=False, indent=2) + '\n')
-            _append(apply_log, f'apply_saved_rawwrap={out_path}')
+        rec = journal['done'].get('apply:' + ts_name)
+        journal['inputs'][ts_name] = _texture_set_hash(key_to_path)
+        if (same_project and rec and rec.get('session_id') == session_id
+                and rec.get('inputs_hash') == journal['inputs'][ts_name]):
+            _log(local_log, f'[journal] skip apply {ts_name} (already applied)')
+            metrics.setdefault('skipped_steps', []).append('apply:' + ts_name)
         else:
-            _write_text(out_path, json.dumps(obj, ensure_ascii=False, indent=2) + '\n')
-            _append(apply_log, f'apply_saved={out_path}')
+            pending.append((ts_name, key_to_path))
+    library = _shared_library_plan(job, tsets + _variant_override_sets(job), local_log)
+    _, resolutions = _project_settings(job)
+    if resolutions:
+        _log(local_log, f'[apply] resolution tiers: {resolutions}')
+    with _phase(metrics, sampler, 'apply'):
+        incomplete = _apply_texture_sets(remote, pending, export_folder, local_log, apply_log, journal=journal, session_id=session_id,
+                            library=library, resolutions=resolutions, metrics=metrics)
+        cleanup = _normalize_remote_json(_remote_exec_block(remote, _build_fill_cleanup([n for (n, _) in tsets]), 'fill_cleanup', local_log, timeout=120))
+        _append(apply_log, 'fill_cleanup=' + json.dumps(cleanup, ensure_ascii=False))
+    if job.get('exportTextures', True) and tsets:
+        _append(apply_log, '--- EXPORT ---')
+        with _phase(metrics, sampler, 'export'):
+            rc = _run_export_stage(remote, job, [n for (n, _) in tsets], export_folder, local_log, apply_log, metrics=metrics)
+        if rc:
+            _append(apply_log, '=== END (export failed) ===')
+            return rc
+        if job.get('repackForUnity', False):
+            with _phase(metrics, sampler, 'repack'):
+                rc = _run_repack_stage(job, [n for (n, _) in tsets], export_folder, local_log, apply_log)
+            if rc:
+                _append(apply_log, '=== END (repack failed) ===')
+                return rc
+    if job.get('variants'):
+        rc, incomplete_variants = _run_variants(remote, job, local_log, apply_log, metrics, sampler, journal, session_id,
+                                                library=library)
+        if rc:
+            _append(apply_log, '=== END (variant failed) ===')
+            return rc
+        incomplete += ['variant:' + n for n in incomplete_variants]
+    if incomplete:
+        # journal stays open: the next run resumes these instead of creating the project again
+        _log(local_log, f'[apply] incomplete: {incomplete}; journal left open for resume')
+        metrics['apply_incomplete'] = incomplete
+    else:
+        _journal_write(journal, 'complete')
+    store_status = _normalize_remote_json(_remote_exec_block(remote, _build_state_status(), 'state_status', local_log, timeout=20))
+    _append(apply_log, 'state_status_after=' + json.dumps(store_status, ensure_ascii=False))
+    # Recycle between jobs: close now so the next run starts a fresh Painter
+    jobs_served = store_status.get('jobs_served') if isinstance(store_status, dict) else None
+    reason = _recycle_reason(job, _painter_rss_mb(pid), jobs_served)
+    if reason:
+        _log(local_log, f'[recycle] Closing Painter after job: {reason}')
+        metrics['recycled_after'] = reason
+        with _phase(metrics, sampler, 'recycle'):
+            _close_painter(remote, pid, local_log, proc=proc)
+    if incomplete:
+        _append(apply_log, '=== END (apply incomplete) ===')
+        return 24
     _append(apply_log, '=== END ===')
-    _log(local_log, f'=== DONE {VERSION} ===')
     return 0
 
+# --- --plan: dry run without Painter ---
+COST_HISTORY_NAME = 'painter_cost_history.jsonl'
+
+# ChannelType members assumed when no run has reported Painter's own list yet
+PLAN_CHANNEL_MEMBERS = ('BaseColor', 'Height', 'Specular', 'Opacity', 'Emissive', 'Displacement', 'Glossiness',
+                        'Roughness', 'Metallic', 'Normal', 'AO', 'Transmissive')
+
+# key fragment -> ChannelType candidates, in the order the remote pick_channel tries them
+PLAN_CHANNEL_ALIASES = (
+    (('base', 'albedo', 'diffuse', 'color'), ('basecolor', 'base_color', 'albedo', 'diffuse', 'color')),
+    (('normal',), ('normal', 'normalmap', 'normal_map')),
+    (('rough',), ('roughness', 'rough')),
+    (('metal',), ('metallic', 'metalness', 'metal')),
+    (('ao', 'occlusion'), ('ao', 'ambientocclusion', 'occlusion')),
+    (('emis', 'emission'), ('emissive', 'emission', 'emis')),
+    (('height', 'parallax', 'displacement'), ('height', 'displacement', 'parallax')),
+)
+
+def _plan_channel(key, members):
+    """Client-side mirror of the apply block's pick_channel: ChannelType member name for key, or None."""
+    lower_to_member = {m.lower(): m for m in members}
+    k = (key or '').lower()
+    if 'metallicsmoothness' in k or 'metallicgloss' in k:
+        return None
+    for cand in (k, k.replace(' ', ''), k.replace('_', '')):
+        if cand in lower_to_member:
+            return lower_to_member[cand]
+    for frags, cands in PLAN_CHANNEL_ALIASES:
+        if any(f in k for f in frags):
+            for cand in cands:
+                if cand in lower_to_member:
+                    return lower_to_member[cand]
+    return None
+
+def _user_data_dir():
+    """Per-user folder for runner state shared across jobs (never the checked-in tool folder)."""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'UnityPainterBridge')
+
+def _cost_history_path(job):
+    return _clean(job.get('costHistoryFile')) or os.path.join(_user_data_dir(), COST_HISTORY_NAME)
+
+def _plan_job(job, history=None):
+    """Planned work for job (texture sets, channels, deduplicated imports) plus the cost-model features."""
+    history = history if history is not None else []
+    members = next((r['channeltype_members'] for r in reversed(history) if r.get('channeltype_members')), None)
+    members = members or PLAN_CHANNEL_MEMBERS
+    settings, per_set = _project_settings(job)
+    doc_res = settings.get('default_texture_resolution') or 2048
+    library_index = {}
+    if _clean(job.get('sharedLibraryFolder')):
+        library_index = (_load_json_file(os.path.join(_clean(job.get('sharedLibraryFolder')), SHARED_INDEX_NAME)) or {}).get('entries') or {}
+    seen = {}
+    sets = []
+    export_mpix = 0.0
+    missing = []
+    for (ts_name, key_to_path) in _extract_texture_sets(job):
+        rows = []
+        for key, path in key_to_path.items():
+            row = {'key': key, 'channel': _plan_channel(key, members), 'path': path}
+            if not os.path.isfile(path):
+                row['missing'] = True
+                missing.append(path)
+                rows.append(row)
+                continue
+            h = _file_sha256(path)
+            dims = lib_image.image_size(path)
+            row.update(bytes=os.path.getsize(path), size=list(dims) if dims else None)
+            if h in seen:
+                row['duplicate_of'] = seen[h]['path']
+            else:
+                seen[h] = {'path': path, 'bytes': row['bytes'], 'pixels': dims[0] * dims[1] if dims else 0,
+                           'library': h in library_index}
+            rows.append(row)
+        res = per_set.get(ts_name) or doc_res
+        export_mpix += res * res * sum(1 for r in rows if r['channel']) / 1e6
+        sets.append({'name': ts_name, 'resolution': res, 'textures': rows})
+    to_import = [v for v in seen.values() if not v['library']]
+    base_unique, base_missing = len(seen), len(missing)
+    # variants: maps that differ from the base are re-imported (unless already imported), every variant is saved
+    variants = []
+    variant_imports = []
+    variant_export_mpix = 0.0
+    base_maps = dict(_extract_texture_sets(job))
+    for variant in job.get('variants') or []:
+        if not isinstance(variant, dict) or not _clean(variant.get('name')):
+            continue
+        vjob = _variant_job(job, variant)
+        _, vper_set = _project_settings(vjob)
+        changed = []
+        for (ts_name, key_to_path) in _extract_texture_sets(vjob):
+            for key, path in key_to_path.items():
+                if (base_maps.get(ts_name) or {}).get(key) == path:
+                    continue
+                changed.append([ts_name, key])
+                if not os.path.isfile(path):
+                    missing.append(path)
+                    continue
+                h = _file_sha256(path)
+                if h not in seen:
+                    dims = lib_image.image_size(path)
+                    seen[h] = {'path': path, 'bytes': os.path.getsize(path), 'pixels': dims[0] * dims[1] if dims else 0,
+                               'library': h in library_index}
+                    if not seen[h]['library']:
+                        variant_imports.append(seen[h])
+        export = bool(vjob.get('exportTextures', True))
+        if export:
+            for (ts_name, key_to_path) in _extract_texture_sets(vjob):
+                res = vper_set.get(ts_name) or doc_res
+                variant_export_mpix += res * res * sum(1 for k in key_to_path if _plan_channel(k, members)) / 1e6
+        variants.append({'name': _clean(variant.get('name')), 'spp': vjob['outputProjectPath'],
+                         'exportFolder': vjob['exportFolder'], 'export': export, 'changed': changed})
+    mesh = _clean(job.get('meshPath'))
+    mesh_bytes = os.path.getsize(mesh) if mesh and os.path.isfile(mesh) else None
+    features = {
+        'mesh_mb': round((mesh_bytes or 0) / 1048576.0, 3),
+        'input_mb': round(((mesh_bytes or 0) + sum(v['bytes'] for v in seen.values())) / 1048576.0, 3),
+        'doc_mpix': round(doc_res * doc_res / 1e6, 3),
+        'sets': len(sets),
+        'imports': len(to_import),
+        'import_mb': round(sum(v['bytes'] for v in to_import) / 1048576.0, 3),
+        'import_mpix': round(sum(v['pixels'] for v in to_import) / 1e6, 3),
+        'export_mpix': round(export_mpix, 3),
+        'variants': len(variants),
+        'variant_imports': len(variant_imports),
+        'variant_import_mpix': round(sum(v['pixels'] for v in variant_imports) / 1e6, 3),
+        'variant_export_mpix': round(variant_export_mpix, 3),
+    }
+    return {
+        'textureSets': sets,
+        'settings': settings,
+        'mesh': {'path': mesh, 'bytes': mesh_bytes},
+        'imports': {'references': sum(len(s['textures']) for s in sets) - base_missing, 'unique': base_unique,
+                    'library_hits': base_unique - len(to_import), 'count': len(to_import),
+                    'bytes': sum(v['bytes'] for v in to_import)},
+        'variants': variants,
+        'missing': missing,
+        'features': features,
+    }
+
+def _plan_main(job_json, job):
+    """--plan: print the planned work and a per-phase time estimate; Painter is never contacted."""
+    history = lib_costmodel.load_history(_cost_history_path(job))
+    plan = _plan_job(job, history)
+    phases = ['startup']
+    if _clean(job.get('stagingFolder')):
+        phases.append('stage_wait')
+    phases += ['ensure_project', 'wait_texturesets', 'apply']
+    if job.get('exportTextures', True):
+        phases.append('export')
+        if job.get('repackForUnity', False):
+            phases.append('repack')
+    if plan['variants']:
+        phases += ['variant_apply', 'variant_save']
+        if any(v['export'] for v in plan['variants']):
+            phases.append('variant_export')
+    model = lib_costmodel.fit(history)
+    est = lib_costmodel.predict(model, plan['features'], phases)
+    plan['estimate'] = {
+        'phases_sec': est,
+        'total_sec': round(sum(est.values()), 1),
+        'history_runs': len(history),
+        'samples': {p: model[p]['samples'] for p in est},
+    }
+    plan = dict({'_version': VERSION, 'job': job_json, 'painter_contacted': False}, **plan)
+    print(json.dumps(plan, ensure_ascii=False, indent=2), flush=True)
+    return 3 if plan['missing'] else 0
+
+def _record_cost_history(job, metrics, local_log):
+    """Append this run's features and phase durations to the cost-model history.
+
+    The features describe the whole job, so resumed runs and runs that skipped a step
+    (journal or up-to-date export) are left out rather than recorded as cheap full runs.
+    """
+    if not metrics.get('plan_features'):
+        return
+    if metrics.get('resumed') or metrics.get('skipped_steps'):
+        skipped = metrics.get('skipped_steps') or []
+        _log(local_log, f"[plan] cost history skipped (resumed={bool(metrics.get('resumed'))}, "
+                        f'skipped steps={skipped[:10]})')
+        return
+    phases = {}
+    for p in metrics.get('phases') or []:
+        phases[p['name']] = round(phases.get(p['name'], 0.0) + p['duration_sec'], 3)
+    row = {'t': round(time.time(), 3), '_version': VERSION, 'features': metrics['plan_features'], 'phases': phases}
+    if metrics.get('channeltype_members'):
+        row['channeltype_members'] = metrics['channeltype_members']
+    try:
+        lib_costmodel.append_history(_cost_history_path(job), row)
+    except Exception as e:
+        _log(local_log, f'[plan] cost history not written: {e}')
+
+def _remote_call_summary(calls):
+    keys = ('build_sec', 'wrap_sec', 'encode_sec', 'http_sec', 'parse_sec')
+    totals = {k: round(sum(c[k] for c in calls), 6) for k in keys}
+    by_kind = {}
+    for c in calls:
+        parts = c['label'].split('_')
+        # apply_poll_<TextureSet> -> apply_poll, apply_<TextureSet> -> apply
+        kind = '_'.join(parts[:2]) if parts[0] == 'apply' and len(parts) > 2 else (parts[0] if parts[0] == 'apply' else c['label'])
+        agg = by_kind.setdefault(kind, dict({k: 0.0 for k in keys}, count=0, bytes_sent=0, bytes_recv=0, double_decoded=0))
+        agg['count'] += 1
+        agg['bytes_sent'] += c['bytes_sent'] or 0
+        agg['bytes_recv'] += c['bytes_recv'] or 0
+        agg['double_decoded'] += 1 if c['double_decoded'] else 0
+        for k in keys:
+            agg[k] = round(agg[k] + c[k], 6)
+    return {'count': len(calls), 'totals': totals, 'by_kind': by_kind}
+
+def _run_profiled(fn, export_folder, local_log):
+    """Run fn under cProfile + tracemalloc and sample this process; reports go to export_folder."""
+    global _CALL_PROFILE
+    import cProfile
+    import io
+    import pstats
+    import tracemalloc
+    _CALL_PROFILE = {'calls': [], 'pending_build_sec': 0.0, 'depth': 0}
+    sampler = lib_process.ProcessSampler(os.getpid(), interval=0.5)
+    sampler.set_phase('runner')
+    sampler.start()
+    tracemalloc.start(25)
+    prof = cProfile.Profile()
+    t0 = time.time()
+    rc = None
+    try:
+        prof.enable()
+        rc = fn()
+        return rc
+    finally:
+        prof.disable()
+        snap = tracemalloc.take_snapshot()
+        cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        sampler.stop()
+        calls, _CALL_PROFILE = _CALL_PROFILE['calls'], None
+        try:
+            prof_path = os.path.join(export_folder, 'runner_profile.prof')
+            prof.dump_stats(prof_path)
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats('cumulative').print_stats(60)
+            _write_text(os.path.join(export_folder, 'runner_profile_top.txt'), buf.getvalue())
+            lines = [f'tracemalloc current={cur / 1048576.0:.2f}MB peak={peak / 1048576.0:.2f}MB', '']
+            lines += [str(st) for st in snap.statistics('lineno')[:40]]
+            _write_text(os.path.join(export_folder, 'runner_alloc_top.txt'), '\n'.join(lines) + '\n')
+            report = {
+                '_version': VERSION,
+                'exit_code': rc,
+                'wall_sec': round(time.time() - t0, 3),
+                'process': sampler.summary(),
+                'process_samples': sampler.samples,
+                'tracemalloc': {'current_mb': round(cur / 1048576.0, 3), 'peak_mb': round(peak / 1048576.0, 3)},
+                'remote_calls': _remote_call_summary(calls),
+                'calls': calls,
+            }
+            _write_text(os.path.join(export_folder, 'runner_profile.json'), json.dumps(report, ensure_ascii=False, indent=2) + '\n')
+            _log(local_log, f'[profile] written {prof_path} (+ runner_profile_top.txt, runner_alloc_top.txt, runner_profile.json)')
+        except Exception as e:
+            _log(local_log, f'[profile] report failed: {e}')
+
+KNOWN_FLAGS = ('--profile', '--plan')
+USAGE = 'Usage: run_painter_job.py job.json [--profile | --plan]'
+
+def _split_argv(argv):
+    """Split command-line arguments into (flags, positional args)."""
+    return {a for a in argv if a.startswith('--')}, [a for a in argv if not a.startswith('--')]
+
+def main():
+    flags, args = _split_argv(sys.argv[1:])
+    unknown = sorted(flags.difference(KNOWN_FLAGS))
+    if unknown:
+        print(f"Unknown option(s): {' '.join(unknown)}", flush=True)
+        print(USAGE, flush=True)
+        return 1
+    if not args:
+        print(USAGE, flush=True)
+        return 1
+    job_json = os.path.abspath(args[0])
+    with open(job_json, 'r', encoding='utf-8-sig') as f:
+        job = json.load(f)
+    if '--plan' in flags:
+        return _plan_main(job_json, job)
+    export_folder = _clean(job.get('exportFolder'))
+    if export_folder and ('--profile' in flags or job.get('profile')):
+        _ensure_dir(export_folder)
+        local_log = os.path.join(export_folder, 'job_runner.local.log')
+        return _run_profiled(lambda: _main_job(job_json, job), export_folder, local_log)
+    return _main_job(job_json, job)
+
+def _main_job(job_json, job):
+    painter_exe = _clean(job.get('painterExePath'))
+    out_spp = _clean(job.get('outputProjectPath'))
+    export_folder = _clean(job.get('exportFolder'))
+    mesh_path = _clean(job.get('meshPath'))
+    save_delay = float(job.get('saveDelaySec', 3.0))
+    reopen_delay = float(job.get('reopenDelaySec', 1.5))
+    if not export_folder:
+        print('exportFolder missing in job.json', flush=True)
+        return 2
+    _ensure_dir(export_folder)
+    local_log = os.path.join(export_folder, 'job_runner.local.log')
+    apply_log = os.path.join(export_folder, 'painter_remote_apply.log')
+    _log(local_log, f'=== START {VERSION} ===')
+    _log(local_log, f'JOB_JSON={job_json}')
+    _log(local_log, f'PainterExe={painter_exe}')
+    _log(local_log, f'OutputSPP={out_spp}')
+    _log(local_log, f'MeshPath={mesh_path}')
+    _log(local_log, f'ExportFolder={export_folder}')
+    _log(local_log, f'saveDelaySec={save_delay}')
+    _log(local_log, f'reopenDelaySec={reopen_delay}')
+    _write_text(apply_log, f'=== START painter_remote_apply.log ({VERSION}) ===\n')
+    _append(apply_log, f'JOB_JSON={job_json}')
+    _append(apply_log, f'OutputSPP={out_spp}')
+    _append(apply_log, f'MeshPath={mesh_path}')
+    _append(apply_log, f'saveDelaySec={save_delay}')
+    _append(apply_log, f'reopenDelaySec={reopen_delay}')
+    metrics = {'_version': VERSION, 'job': job_json, 'start': round(time.time(), 3), 'phases': [], 'exit_code': None}
+    sampler = lib_process.ProcessSampler(interval=float(job.get('sampleIntervalSec', 1.0)))
+    rc = None
+    try:
+        rc = _run_job(job, local_log, apply_log, metrics, sampler)
+        if rc == 0:
+            _log(local_log, f'=== DONE {VERSION} ===')
+        return rc
+    finally:
+        sampler.stop()
+        metrics['exit_code'] = rc
+        metrics['end'] = round(time.time(), 3)
+        metrics['painter'] = sampler.summary()
+        metrics['painter_samples'] = sampler.samples
+        if rc == 0:
+            _record_cost_history(job, metrics, local_log)
+        metrics_path = os.path.join(export_folder, 'painter_run_metrics.json')
+        try:
+            _write_text(metrics_path, json.dumps(metrics, ensure_ascii=False, indent=2) + '\n')
+        except Exception as e:
+            _log(local_log, f'[metrics] write failed: {e}')
+
 if __name__ == '__main__':
     try:
         raise SystemExit(main())
@@ -970,8 +3238,9 @@ if __name__ == '__main__':
         traceback.print_exc()
         # Try to write error to log file if possible
         try:
-            if len(sys.argv) >= 2:
-                job_json = os.path.abspath(sys.argv[1])
+            _, args = _split_argv(sys.argv[1:])
+            if args:
+                job_json = os.path.abspath(args[0])
                 with open(job_json, 'r', encoding='utf-8-sig') as f:
                     job = json.load(f)
                 ef = (job.get('exportFolder') or '').strip()
@@ -0,0 +1,70 @@
+# test_repack_textures.py
+# Band-level checks of the MetallicSmoothness packing (python -m unittest / pytest; needs numpy and Pillow).
+import os
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = Image = None
+
+import repack_textures as rt
+
+@unittest.skipIf(np is None, 'numpy and Pillow are required')
+class PackMetallicSmoothnessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _save(self, name, arr):
+        path = os.path.join(self.dir, name)
+        Image.fromarray(arr).save(path)
+        return path
+
+    def _pack(self, metal, rough, band_rows=3):
+        out = os.path.join(self.dir, 'Body_MetallicSmoothness.png')
+        rt._pack_metallic_smoothness(metal, rough, out, band_rows)
+        with Image.open(out) as im:
+            return np.asarray(im.convert('RGBA'))
+
+    def test_8bit(self):
+        metal = self._save('Body_Metallic.png', np.full((7, 5), 200, np.uint8))
+        rough = self._save('Body_Roughness.png', np.full((7, 5), 55, np.uint8))
+        px = self._pack(metal, rough)
+        self.assertEqual(px.shape, (7, 5, 4))
+        self.assertTrue((px[..., 0] == 200).all())
+        self.assertTrue((px[..., 3] == 200).all())
+
+    def test_16bit_scale_is_per_image_not_per_band(self):
+        # dark band (all values <= 255) followed by a bright band: both must use the 16-bit scale
+        rough = np.full((6, 4), 200, np.uint16)
+        rough[3:] = 65535
+        path = self._save('Body_Roughness.png', rough)
+        with Image.open(path) as im:
+            self.assertEqual(rt._unit_scale(im), 65535.0)
+        px = self._pack(None, path, band_rows=3)
+        self.assertTrue((px[:3, :, 3] >= 254).all())  # 1 - 200/65535, not 1 - 200/255
+        self.assertTrue((px[3:, :, 3] == 0).all())
+
+    def test_rgb_gray_input_uses_first_channel(self):
+        rgb = np.zeros((4, 4, 3), np.uint8)
+        rgb[..., 0] = 128
+        metal = self._save('Body_Metallic.png', rgb)
+        px = self._pack(metal, None)
+        self.assertTrue((px[..., 0] == 128).all())
+        self.assertTrue((px[..., 3] == 128).all())
+
+class ClassifyTest(unittest.TestCase):
+
+    def test_packed_metallic_smoothness_passes_through(self):
+        self.assertEqual(rt._classify('Body_MetallicSmoothness.png', 'Body'), 'MetallicSmoothness')
+        self.assertEqual(rt._classify('Body_Roughness.png', 'Body'), 'Roughness')
+
+if __name__ == '__main__':
+    unittest.main()